@@ -0,0 +1,563 @@
+import gc
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from bus_health import FrameTiming
+from can_decoder import FrameDecoder, build_decoder_table, multiplexed_slots, signal_choices, signal_keys
+from can_filters import install_filters
+from dbc_cache import dbc_cache_key, read_cached_dbc, write_cached_dbc
+from diagnostics import DECODE_ERRORS, log_limited
+from quarantine import FrameQuarantine
+from metrics import (BATCHES, COMMIT_SECONDS, DECODE_SECONDS, FRAMES_DECODED, FRAMES_IGNORED, FRAMES_RECEIVED,
+                     RECV_QUEUE_DEPTH)
+from signal_history import history_depth
+from signal_store import SignalStore
+
+# python-can and cantools are imported where they are used: they are slow to import, and
+# importing the server (reloads, tests, spawned processes) shouldn't pay for them up front
+if TYPE_CHECKING:
+    import cantools
+
+# Spawned (not forked) on every platform: forking a process that already runs uvicorn and
+# the logging threads is unsafe, and spawn is what Windows does anyway
+_CONTEXT = multiprocessing.get_context("spawn")
+
+# How often the acquisition process checks that the API process is still alive (s)
+PARENT_CHECK_INTERVAL = 1.0
+# How often it answers quarantine commands from the API process (s), and how long the API
+# process waits for the answer
+CONTROL_INTERVAL = 0.1
+CONTROL_TIMEOUT = 2.0
+
+# bus.recv() timeout while the bus is idle (s)
+RECV_TIMEOUT = 0.1
+# Most frames drained into one batch; bounds how long a batch commit keeps readers waiting
+MAX_BATCH = 512
+# Upper bounds of the batch size histogram buckets; the last bucket is open-ended
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+# Oldest plausible frame timestamp relative to the batch (s); older or future ones (a driver
+# clock that isn't epoch-based, a skewed hardware clock) are stamped with the batch time
+MAX_FRAME_AGE = 2.0
+# How often the receive loop logs a summary line (s)
+STATUS_INTERVAL = 10.0
+
+# Segments of stopped acquisition processes. They are unlinked straight away but can only be
+# closed once no reader (an in-flight request, a stream client) still holds their store.
+_retired_segments: List[shared_memory.SharedMemory] = []
+
+
+# Merge DBC files into one database. Files that fail to load are reported and skipped,
+# unless strict (then the first error is raised). Parsed databases are cached on disk by
+# file contents, so restarts, re-uploads and acquisition processes skip the parse. Only a
+# load where every file parsed is cached: a partial database would otherwise be served from
+# the cache, without the error, until the files change.
+def load_dbc(dbc_paths: Sequence[str], strict: bool = False) -> "cantools.database.Database":
+    cache_key = dbc_cache_key(dbc_paths)
+    dbc = read_cached_dbc(cache_key)
+    if dbc is not None:
+        print(f"✅ Loaded DBC files from cache: {', '.join(dbc_paths)}")
+        return dbc
+    import cantools
+    dbc = cantools.database.Database()
+    complete = True
+    for dbc_path in dbc_paths:
+        try:
+            dbc.add_dbc_file(dbc_path)
+            print(f"✅ Loaded DBC file: {dbc_path}")
+        except Exception as e:
+            if strict:
+                raise
+            complete = False
+            print(f"❌ Error loading DBC file {dbc_path}: {e}")
+    if complete:
+        write_cached_dbc(cache_key, dbc)
+    return dbc
+
+
+# Open the python-can bus of a channel. {"interface": "replay", "channel": "<trace file>",
+# "speed": 10.0, "loop": True} plays a recorded trace (see replay.ReplayBus) instead of
+# opening hardware. With a DBC, only its frame IDs (minus ignored IDs) are accepted where the
+# interface filters in the kernel or hardware (see can_filters.install_filters);
+# open_filter=True receives every frame regardless (raw capture).
+def open_bus(bus_config: Dict[str, Any], dbc=None, ignored_ids: Sequence[int] = (), open_filter: bool = False):
+    if bus_config.get("interface") == "replay":
+        from replay import ReplayBus
+        replay_config = {key: value for key, value in bus_config.items() if key != "interface"}
+        bus = ReplayBus(**replay_config)
+    else:
+        import can
+        bus = can.interface.Bus(**bus_config)
+    print(f"🔎 {install_filters(bus, bus_config.get('interface'), dbc, ignored_ids, open_filter)}")
+    return bus
+
+
+# Receive counters: frames, batches, largest batch, decode errors, frames decoded, frames
+# skipped as ignored or quarantined, then the batch size histogram. Plain int64 counters
+# written only by the receive loop; in process mode they live in a shared array so the API
+# process can read them.
+class ReceiveStats:
+    FRAMES = 0
+    BATCHES = 1
+    MAX_BATCH = 2
+    DECODE_ERRORS = 3
+    DECODED = 4
+    IGNORED = 5
+    HISTOGRAM = 6
+    size = HISTOGRAM + len(BATCH_BUCKETS) + 1
+
+    def __init__(self, counters=None):
+        self.counters = counters if counters is not None else array('q', [0]) * self.size
+
+    def record(self, batch_size: int, decode_errors: int, decoded: int = 0, ignored: int = 0):
+        counters = self.counters
+        counters[self.FRAMES] += batch_size
+        counters[self.BATCHES] += 1
+        if batch_size > counters[self.MAX_BATCH]:
+            counters[self.MAX_BATCH] = batch_size
+        if decode_errors:
+            counters[self.DECODE_ERRORS] += decode_errors
+        counters[self.DECODED] += decoded
+        if ignored:
+            counters[self.IGNORED] += ignored
+        counters[self.HISTOGRAM + bisect_left(BATCH_BUCKETS, batch_size)] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        counters = list(self.counters)
+        frames = counters[self.FRAMES]
+        batches = counters[self.BATCHES]
+        labels = [f"<={bound}" for bound in BATCH_BUCKETS] + [f">{BATCH_BUCKETS[-1]}"]
+        return {
+            "frames": frames,
+            "batches": batches,
+            "mean_batch": frames / batches if batches else 0.0,
+            "max_batch": counters[self.MAX_BATCH],
+            "decode_errors": counters[self.DECODE_ERRORS],
+            "decoded": counters[self.DECODED],
+            "ignored": counters[self.IGNORED],
+            "batch_histogram": dict(zip(labels, counters[self.HISTOGRAM:]))
+        }
+
+
+# Receive loop shared by the receive thread and the acquisition process.
+#
+# Blocks for the first frame, then drains whatever else is already pending (up to
+# MAX_BATCH) without waiting, decodes the whole batch and commits it to the store at once:
+# one seqlock write section and one generation bump per batch instead of per frame. Each
+# frame keeps its own receive time: message.timestamp (epoch) moved onto the monotonic
+# clock the store uses.
+# get_target() returns the (decoder_table, store, timing) triple (timing: the table's
+# FrameTiming, or None) and get_capture() the active raw capture (or None); both are read
+# once per batch, so a DBC swap applies from the next batch.
+# Frame, batch, decode and ignore counts go to `stats` and, with decode time per frame ID,
+# batch sizes and commit time, to the hot-path metrics.
+# Failures go to the error ring (under the channel name) and the rate-limited log: a frame
+# that fails on every arrival costs a ring write, not a formatted console line. With a quarantine, frame IDs it
+# skips (ignored, or failing persistently) are counted by the frame timing but not decoded.
+def receive_loop(bus, get_target: Callable[[], Tuple[Dict, SignalStore, Optional[FrameTiming]]],
+                 stats: ReceiveStats, keep_running: Callable[[], bool], get_capture: Optional[Callable[[], Any]] = None,
+                 quarantine: Optional[FrameQuarantine] = None, channel: str = ""):
+    import can
+    recv = bus.recv
+    monotonic = time.monotonic
+    wall_time = time.time
+    perf_counter = time.perf_counter
+    decode_seconds = DECODE_SECONDS.labels
+    next_status = monotonic() + STATUS_INTERVAL
+    while keep_running():
+        try:
+            message = recv(RECV_TIMEOUT)
+            if message is None:
+                continue
+            batch = [message]
+            while len(batch) < MAX_BATCH:
+                message = recv(0)
+                if message is None:
+                    break
+                batch.append(message)
+        except can.CanError as e:
+            log_limited("bus_error", logging.WARNING, "⚠️ CAN Bus error: %s", e)
+            time.sleep(1)  # Wait a bit before retrying
+            continue
+
+        RECV_QUEUE_DEPTH.observe(len(batch))
+        decoder_table, store, timing = get_target()
+        observe_timing = timing.observe if timing is not None else None
+        capture = get_capture() if get_capture is not None else None
+        now = monotonic()
+        to_monotonic = now - wall_time()
+        oldest = now - MAX_FRAME_AGE
+        if quarantine is not None:
+            quarantine.tick(now)
+            skip = quarantine.skip
+        else:
+            skip = ()
+        updates = []
+        decode_errors = 0
+        ignored = 0
+        for message in batch:
+            # Raw capture keeps every frame, decoded or not
+            if capture is not None:
+                capture.append(message)
+            entry = decoder_table.get(message.arbitration_id)
+            if entry is None:
+                continue
+            if observe_timing is not None:
+                observe_timing(entry, message)
+            if skip and message.arbitration_id in skip:
+                ignored += 1
+                continue
+            start = perf_counter()
+            try:
+                decoded_data = entry.decode(message.data)
+            except Exception as decode_error:
+                decode_errors += 1
+                DECODE_ERRORS.record(channel, message.arbitration_id, message.data, decode_error)
+                log_limited(("decode", channel, message.arbitration_id), logging.WARNING,
+                            "⚠️ Error decoding message %s (ID: 0x%X): %s",
+                            entry.message_name, message.arbitration_id, decode_error)
+                if quarantine is not None and quarantine.failed(message.arbitration_id, monotonic()):
+                    skip = quarantine.skip
+                continue
+            decode_seconds(message.arbitration_id).observe(perf_counter() - start)
+            slots = entry.slots if entry.key_map is None else multiplexed_slots(entry, decoded_data)
+            received = message.timestamp + to_monotonic
+            if not oldest <= received <= now:
+                received = now
+            updates.append((slots, decoded_data.values(), received))
+        if updates:
+            start = perf_counter()
+            store.commit_batch(updates)
+            COMMIT_SECONDS.observe(perf_counter() - start)
+        stats.record(len(batch), decode_errors, len(updates), ignored)
+        FRAMES_RECEIVED.inc(len(batch))
+        FRAMES_DECODED.inc(len(updates))
+        if ignored:
+            FRAMES_IGNORED.inc(ignored)
+        BATCHES.inc()
+
+        now = monotonic()
+        if now >= next_status:
+            summary = stats.stats()
+            log_limited("status", logging.INFO,
+                        "📡 Received %d CAN frames in %d batches (mean %.1f, max %d), decoded %d, ignored %d",
+                        summary['frames'], summary['batches'], summary['mean_batch'], summary['max_batch'],
+                        summary['decoded'], summary['ignored'])
+            next_status = now + STATUS_INTERVAL
+
+
+# One CAN bus to acquire: python-can Bus settings and the DBC files describing it.
+# The name namespaces the channel's signal keys ("inverter.Message.Signal"); a single
+# unnamed channel keeps plain "Message.Signal" keys.
+class ChannelConfig(NamedTuple):
+    name: str
+    bus: Dict[str, Any]
+    dbc_files: Tuple[str, ...]
+
+
+# A channel with its DBC loaded
+class Channel(NamedTuple):
+    config: ChannelConfig
+    dbc: "cantools.database.Database"
+    decoder_table: Dict[int, FrameDecoder]
+    # Per-frame-ID timing, filled by the channel's receive loop
+    timing: FrameTiming
+
+
+def validate_channels(configs: Sequence[ChannelConfig]):
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate CAN channel names: {names}")
+    if len(configs) > 1 and "" in names:
+        raise ValueError("Every CAN channel needs a name when more than one is configured")
+
+
+# Load every channel's DBC files. Slots are assigned channel by channel over one shared
+# layout, so all channels feed one store and the same configs always give the same keys.
+def load_channels(configs: Sequence[ChannelConfig], strict: bool = False) -> List[Channel]:
+    validate_channels(configs)
+    signal_slots: Dict[str, int] = {}
+    channels = []
+    for config in configs:
+        dbc = load_dbc(config.dbc_files, strict)
+        decoder_table = build_decoder_table(dbc, config.name, signal_slots)
+        channels.append(Channel(config, dbc, decoder_table, FrameTiming(decoder_table)))
+    return channels
+
+
+# Signal keys of all channels, indexed by slot
+def channel_keys(channels: Sequence[Channel]) -> List[str]:
+    return signal_keys(*(channel.decoder_table for channel in channels))
+
+
+def _close_retired_segments():
+    for segment in list(_retired_segments):
+        try:
+            segment.close()
+        except BufferError:
+            continue
+        _retired_segments.remove(segment)
+
+
+# CAN receive/decode in dedicated processes, one per channel.
+#
+# The API process creates a shared-memory segment sized for the signal store of the loaded
+# channels and maps it read-only (`store`); each acquisition process loads its channel's
+# DBC files, checks that it derives keys of the same layout (so slots line up), attaches to
+# the segment and commits decoded frames into it under a shared write lock. HTTP load in the
+# API process can't delay bus.recv() any more, buses are spread over cores, and the seqlock
+# in the segment keeps cross-process reads consistent.
+#
+# Each process has its own frame quarantine, started with the channel's ignored IDs; the API
+# process reads and changes it through a control pipe (see control()).
+class AcquisitionProcess:
+    def __init__(self, channels: Sequence[Channel], keys: Sequence[str], history_points: int,
+                 previous: Optional[SignalStore] = None, ignored: Optional[Sequence[Sequence[int]]] = None):
+        self.keys = tuple(keys)
+        self.segment = shared_memory.SharedMemory(
+            create=True, size=SignalStore.buffer_size(len(self.keys), history_points))
+        # Initialise the segment (and keep the values of the previous DBC's store)
+        writer = SignalStore(self.keys, history_points, buffer=self.segment.buf)
+        if previous is not None:
+            writer.carry_over(previous)
+        del writer
+        self.store = SignalStore(self.keys, history_points, buffer=self.segment.buf.toreadonly(), attach=True)
+        self.configs = [channel.config for channel in channels]
+        self.stats = [ReceiveStats(_CONTEXT.Array('q', ReceiveStats.size, lock=False)) for _ in self.configs]
+        # Frame timing arrays shared the same way, laid out by each channel's decoder table
+        self.timing = []
+        for channel in channels:
+            counter_size, time_size = FrameTiming.buffer_sizes(len(channel.decoder_table))
+            self.timing.append(FrameTiming(channel.decoder_table, _CONTEXT.Array('q', counter_size, lock=False),
+                                           _CONTEXT.Array('d', time_size, lock=False)))
+        # Kept referenced: the children unpickle the lock (and event) after this returns
+        self._write_lock = _CONTEXT.Lock() if len(self.configs) > 1 else None
+        self._stop = _CONTEXT.Event()
+        self.processes = []
+        self._controls = []
+        # One command in flight per pipe: requests from several API threads take turns
+        self._control_lock = threading.Lock()
+        if ignored is None:
+            ignored = [()] * len(self.configs)
+        for config, stats, timing, channel_ignored in zip(self.configs, self.stats, self.timing, ignored):
+            control, child_control = _CONTEXT.Pipe()
+            process = _CONTEXT.Process(
+                target=_acquisition_main,
+                args=(self.segment.name, config, self.keys, history_points, stats.counters, timing.counters,
+                      timing.times, self._write_lock, self._stop, child_control, tuple(channel_ignored)),
+                name=f"can-acquisition-{config.name or 'default'}",
+                daemon=True
+            )
+            process.start()
+            child_control.close()
+            self.processes.append(process)
+            self._controls.append(control)
+            print(f"✅ Started acquisition process for channel '{config.name}' (pid {process.pid})")
+        print(f"📦 Signal table shared through {self.segment.name} ({self.segment.size} bytes)")
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [{
+            "pid": process.pid,
+            "alive": process.is_alive(),
+            "exitcode": process.exitcode
+        } for process in self.processes]
+
+    # Quarantine command for the process of channel `index`: ("status",) returns its
+    # FrameQuarantine.status(), ("ignore", id) / ("release", id) whether that changed anything.
+    # Blocks until the answer (up to CONTROL_TIMEOUT): call it from a worker thread.
+    def control(self, index: int, command: str, frame_id: Optional[int] = None):
+        control = self._controls[index]
+        with self._control_lock:
+            try:
+                # Drop a late answer to a command that timed out
+                while control.poll():
+                    control.recv()
+                control.send((command, frame_id))
+                if control.poll(CONTROL_TIMEOUT):
+                    return control.recv()
+            except (OSError, EOFError):
+                pass
+        raise TimeoutError(f"Acquisition process of channel '{self.configs[index].name}' is not responding")
+
+    # Stop the processes and release the segment. `store` stays readable until it is dropped.
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                print(f"⚠️ Acquisition process {process.pid} did not stop, terminating it")
+                process.terminate()
+                process.join()
+        for control in self._controls:
+            control.close()
+        self.segment.unlink()
+        _retired_segments.append(self.segment)
+        _close_retired_segments()
+
+
+# Everything decoding depends on, built together whenever DBC files change and published
+# with a single reference assignment: readers take the current generation once and use
+# its channels (databases, decoder tables), ID map and store, which never change after
+# construction, so a DBC upload can never be seen half-applied.
+class DecoderGeneration(NamedTuple):
+    channels: Tuple[Channel, ...]
+    # Channel name -> {frame ID -> message name}; the same ID may mean different messages on
+    # different buses
+    valid_can_ids: Dict[str, Dict[int, str]]
+    store: SignalStore
+    # Set in process mode: the acquisition processes writing `store`
+    acquisition: Optional[AcquisitionProcess]
+
+
+# Load the DBC files of every channel and build the store for them (slow: meant for a worker
+# thread). The latest values of the previous generation are carried over; in process mode
+# its acquisition processes are stopped and new ones started on the new files, skipping the
+# frame IDs in `ignored` (one list per channel). With strict, a DBC file that fails to load
+# raises instead of being skipped. `history_points` is the most history points per signal;
+# with many signals each gets fewer (see signal_history.history_depth), 0 disables history.
+def load_generation(configs: Sequence[ChannelConfig], history_points: int, in_process: bool = False,
+                    previous: Optional[DecoderGeneration] = None, strict: bool = False,
+                    ignored: Optional[Sequence[Sequence[int]]] = None) -> DecoderGeneration:
+    channels = load_channels(configs, strict)
+    keys = channel_keys(channels)
+    history_points = history_depth(len(keys), history_points)
+    valid_can_ids = {channel.config.name: {msg.frame_id: msg.name for msg in channel.dbc.messages}
+                     for channel in channels}
+    previous_store = previous.store if previous is not None else None
+    acquisition = None
+    if in_process:
+        # The old processes must release the buses first
+        if previous is not None and previous.acquisition is not None:
+            previous.acquisition.stop()
+        acquisition = AcquisitionProcess(channels, keys, history_points, previous=previous_store, ignored=ignored)
+        store = acquisition.store
+        # Timing is filled in the acquisition processes, through shared arrays
+        channels = [channel._replace(timing=timing) for channel, timing in zip(channels, acquisition.timing)]
+    else:
+        # Receive threads of several channels take turns committing
+        store = SignalStore(keys, history_points, write_lock=threading.Lock() if len(channels) > 1 else None)
+        if previous_store is not None:
+            store.carry_over(previous_store)
+    # Labels /vehicle_data, the stream and the logs serve for value-described signals
+    store.choices = signal_choices(*(channel.decoder_table for channel in channels))
+    return DecoderGeneration(tuple(channels), valid_can_ids, store, acquisition)
+
+
+# Entry point of an acquisition process. The store, timing and quarantine only live in
+# _acquire()'s frame, so they are gone by the time the segment is closed; an error is printed
+# rather than propagated, because its traceback would keep that frame (and the store's views
+# into the segment) alive.
+def _acquisition_main(segment_name: str, config: ChannelConfig, keys: Sequence[str], history_points: int,
+                      counters, timing_counters, timing_times, write_lock, stop_event, control, ignored):
+    segment = shared_memory.SharedMemory(name=segment_name)
+    try:
+        _acquire(segment.buf, config, keys, history_points, counters, timing_counters, timing_times,
+                 write_lock, stop_event, control, ignored)
+    except Exception as error:
+        print(f"❌ Acquisition process for channel '{config.name}' failed: {error!r}")
+    finally:
+        control.close()
+        # Reference cycles (closures of the receive loop) may still hold the store
+        gc.collect()
+        try:
+            segment.close()
+        except BufferError:
+            # The mapping goes away with the process (the API process unlinks the segment);
+            # kept referenced so the garbage collector doesn't retry the close
+            _retired_segments.append(segment)
+            print(f"⚠️ Acquisition process for channel '{config.name}': signal store still referenced, "
+                  f"leaving its shared memory to process exit")
+
+
+def _acquire(buffer, config: ChannelConfig, keys: Sequence[str], history_points: int,
+             counters, timing_counters, timing_times, write_lock, stop_event, control, ignored):
+    # Build the table against the API process's layout; any key it doesn't know means the
+    # DBC files differ and slots wouldn't line up
+    signal_slots = {key: slot for slot, key in enumerate(keys)}
+    dbc = load_dbc(config.dbc_files)
+    decoder_table = build_decoder_table(dbc, config.name, signal_slots)
+    if len(signal_slots) != len(keys):
+        print(f"❌ Acquisition process: DBC signals of channel '{config.name}' differ from the API process, not starting")
+        return
+    store = SignalStore(keys, history_points, buffer=buffer, attach=True, write_lock=write_lock)
+    timing = FrameTiming(decoder_table, timing_counters, timing_times)
+    _receive_frames(decoder_table, store, timing, config, dbc, ReceiveStats(counters), stop_event,
+                    control, FrameQuarantine(ignored))
+
+
+# Answer the API process's pending quarantine commands (see AcquisitionProcess.control()).
+# on_change runs after the ignored IDs changed, to reinstall the acceptance filters.
+def _serve_control(control, quarantine: FrameQuarantine, on_change: Optional[Callable[[], None]] = None):
+    while control.poll():
+        command, frame_id = control.recv()
+        if command == "status":
+            reply = quarantine.status()
+        elif command == "ignore":
+            reply = quarantine.ignore(frame_id)
+        elif command == "release":
+            reply = quarantine.release(frame_id)
+        else:
+            reply = None
+        if reply is True and on_change is not None:
+            on_change()
+        control.send(reply)
+
+
+def _receive_frames(decoder_table, store: SignalStore, timing: FrameTiming, config: ChannelConfig,
+                    dbc, stats: ReceiveStats, stop_event, control, quarantine: FrameQuarantine):
+    bus_config = config.bus
+    parent = multiprocessing.parent_process()
+    next_parent_check = time.monotonic() + PARENT_CHECK_INTERVAL
+    next_control_check = 0.0
+    bus = None
+
+    def apply_filters():
+        print(f"🔎 {install_filters(bus, bus_config.get('interface'), dbc, quarantine.ignored)}")
+
+    # Don't keep the bus open if the API process died without stopping us; between batches,
+    # answer quarantine commands
+    def keep_running():
+        nonlocal next_parent_check, next_control_check
+        if stop_event.is_set():
+            return False
+        now = time.monotonic()
+        if now >= next_control_check:
+            next_control_check = now + CONTROL_INTERVAL
+            _serve_control(control, quarantine, apply_filters)
+        if now >= next_parent_check:
+            next_parent_check = now + PARENT_CHECK_INTERVAL
+            return parent is None or parent.is_alive()
+        return True
+
+    try:
+        # Only the DBC's frame IDs that aren't ignored are delivered (the process restarts when
+        # the DBC changes, and reinstalls the filters when the ignored IDs do)
+        bus = open_bus(bus_config, dbc, quarantine.ignored)
+        print(f"✅ Acquisition process connected to {bus_config.get('interface')} {bus_config.get('channel')}")
+        target = (decoder_table, store, timing)
+        receive_loop(bus, lambda: target, stats, keep_running, quarantine=quarantine, channel=config.name)
+
+    except Exception as setup_error:
+        print(f"❌ Failed to setup CAN interface: {setup_error}")
+        print("⚠️ Falling back to mock data generation")
+        _generate_mock_values(decoder_table, store, stop_event, control, quarantine)
+
+    finally:
+        if bus is not None:
+            bus.shutdown()
+            print("💤 CAN bus shutdown")
+
+
+def _generate_mock_values(decoder_table, store: SignalStore, stop_event, control, quarantine: FrameQuarantine):
+    print("🔄 Using mock data generation")
+    parent = multiprocessing.parent_process()
+    while not stop_event.wait(0.5) and (parent is None or parent.is_alive()):
+        _serve_control(control, quarantine)
+        for entry in decoder_table.values():
+            store.commit(entry.slots, [random.uniform(0, 100) for _ in entry.slots], time.monotonic())
@@ -0,0 +1,130 @@
+# Micro-benchmark for the receive_can_data() decode step: the original per-frame
+# valid_can_ids / get_message_by_frame_id / decode_message / f-string path versus the
+# prebuilt decoder table committing into the signal store.
+#
+# Frames come from a recorded trace readable by python-can (BLF, ASC, CSV, TRC, ...) or,
+# when no trace is given, are re-encoded from the recorded signal values in logs/keymetrics-*.csv.
+#
+#   python benchmarks/bench_decode.py --dbc INV_CAN_cm.dbc --dbc NX0002.dbc [--frames trace.blf]
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import cantools
+import can
+
+from can_decoder import build_decoder_table, multiplexed_slots, signal_keys
+from signal_store import SignalStore
+
+LOG_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "logs")
+
+
+# Load (arbitration_id, data) pairs from a python-can readable trace
+def load_trace_frames(path):
+    return [(msg.arbitration_id, bytes(msg.data)) for msg in can.LogReader(path)
+            if not msg.is_error_frame and not msg.is_remote_frame]
+
+
+# Rebuild frames from the keymetrics CSV logs by encoding every logged row through the DBC
+def load_keymetrics_frames(dbc, pattern):
+    frames = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, newline="") as csvfile:
+            for row in csv.DictReader(csvfile):
+                for message in dbc.messages:
+                    values = {}
+                    found = False
+                    for sig in message.signals:
+                        raw = row.get(f"{message.name}.{sig.name}")
+                        if raw:
+                            values[sig.name] = float(raw)
+                            found = True
+                        else:
+                            values[sig.name] = 0
+                    if not found:
+                        continue
+                    try:
+                        data = message.encode(values, strict=False)
+                    except Exception:
+                        continue
+                    frames.append((message.frame_id, data))
+    return frames
+
+
+# The original hot loop body, kept verbatim for comparison
+def decode_before(dbc, valid_can_ids, frames, vehicle_data):
+    for arbitration_id, data in frames:
+        if arbitration_id in valid_can_ids:
+            message_name = valid_can_ids[arbitration_id]
+            try:
+                dbc_message = dbc.get_message_by_frame_id(arbitration_id)
+                decoded_data = dbc.decode_message(arbitration_id, data)
+                formatted_data = {f"{message_name}.{sig_name}": value
+                                  for sig_name, value in decoded_data.items()}
+                vehicle_data.update(formatted_data)
+            except Exception:
+                pass
+
+
+# The decoder-table hot loop body, committing into the signal store
+def decode_after(decoder_table, frames, signal_store):
+    monotonic = time.monotonic
+    for arbitration_id, data in frames:
+        entry = decoder_table.get(arbitration_id)
+        if entry is not None:
+            try:
+                decoded_data = entry.decode(data)
+                slots = entry.slots if entry.key_map is None else multiplexed_slots(entry, decoded_data)
+                signal_store.commit(slots, decoded_data.values(), monotonic())
+            except Exception:
+                pass
+
+
+# Best-of-N frames/sec for one variant
+def measure(run, frames, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return len(frames) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode-loop micro-benchmark")
+    parser.add_argument("--dbc", action="append", required=True, help="DBC file (repeatable)")
+    parser.add_argument("--frames", help="Recorded trace readable by can.LogReader")
+    parser.add_argument("--logs", default=os.path.join(LOG_DIRECTORY, "keymetrics-*.csv"),
+                        help="Glob of keymetrics CSV logs used when no trace is given")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    dbc = cantools.database.Database()
+    for dbc_path in args.dbc:
+        dbc.add_dbc_file(dbc_path)
+    valid_can_ids = {msg.frame_id: msg.name for msg in dbc.messages}
+    decoder_table = build_decoder_table(dbc)
+    signal_store = SignalStore(signal_keys(decoder_table))
+
+    frames = load_trace_frames(args.frames) if args.frames else load_keymetrics_frames(dbc, args.logs)
+    if not frames:
+        print("❌ No frames to benchmark")
+        return 1
+
+    before = measure(lambda: decode_before(dbc, valid_can_ids, frames, {}), frames, args.repeat)
+    after = measure(lambda: decode_after(decoder_table, frames, signal_store), frames, args.repeat)
+
+    print(f"Frames:  {len(frames)} ({len({f[0] for f in frames})} distinct IDs)")
+    print(f"Before:  {before:,.0f} frames/sec")
+    print(f"After:   {after:,.0f} frames/sec")
+    print(f"Speedup: {after / before:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
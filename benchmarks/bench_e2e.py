@@ -0,0 +1,371 @@
+# End-to-end benchmark on the python-can `virtual` interface: a sender thread plays
+# synthetic frames generated from the DBC (random in-range signal values) at a configured
+# rate and ID mix, the receive loop decodes them into a signal store, and the suite measures
+#
+#   - sustained throughput and dropped frames (the receive queue is bounded like a driver's,
+#     frames that don't fit are dropped), for each --rate (0 = as fast as the sender can),
+#   - send-to-store latency percentiles (virtual bus send timestamp -> batch commit),
+#   - /vehicle_data latency percentiles under concurrent pollers (the real endpoint, called
+#     in-process through ASGI, so HTTP parsing and sockets are not included),
+#   - memory growth of the logger (ColumnarRecorder + DeadlineSampler, traced with
+#     tracemalloc) while it logs every signal.
+#
+# Results are printed and written as JSON (--output, or stdout) for regression tracking.
+#
+#   python benchmarks/bench_e2e.py --dbc INV_CAN_cm.dbc --dbc NX0002.dbc [--rate 4000 --rate 0]
+#          [--messages 20] [--mix zipf] [--duration 10] [--pollers 8] [--output e2e.json]
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import can
+import orjson
+
+from acquisition import Channel, ChannelConfig, DecoderGeneration, ReceiveStats, load_dbc, receive_loop
+from bus_health import FrameTiming
+from can_decoder import build_decoder_table, signal_keys
+from log_recorder import LOG_WRITERS, ColumnarRecorder, make_row_getter
+from sampler import DeadlineSampler
+from signal_history import history_depth
+from signal_store import SignalStore
+
+# Distinct payloads generated per message
+PAYLOADS_PER_MESSAGE = 16
+# Length of the pregenerated frame sequence the sender cycles through
+SEQUENCE_LENGTH = 10_000
+# Time the receiver gets to catch up after the sender stops (s)
+DRAIN_GRACE = 2.0
+# How often the paced sender wakes up (s)
+SEND_TICK = 0.001
+# How often logger memory is sampled (s)
+MEMORY_SAMPLE_INTERVAL = 0.5
+
+
+def percentiles(samples, scale=1.0):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * scale
+
+    return {"count": len(ordered), "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": ordered[-1] * scale}
+
+
+# Random in-range values for a message, encoded; random bytes if the DBC can't encode them
+def synthetic_payload(message, rng):
+    values = {}
+    for sig in message.signals:
+        low = sig.minimum if sig.minimum is not None else 0
+        high = sig.maximum if sig.maximum is not None else low
+        if sig.choices:
+            values[sig.name] = rng.choice(list(sig.choices))
+        elif sig.is_float:
+            values[sig.name] = rng.uniform(low, high)
+        else:
+            values[sig.name] = low + sig.scale * rng.randint(0, max(0, int((high - low) / sig.scale)))
+    try:
+        return message.encode(values, strict=False)
+    except Exception:
+        return bytes(rng.getrandbits(8) for _ in range(message.length))
+
+
+# Frame sequence for the sender: `messages` DBC messages (0 = all), picked uniformly or with
+# Zipf-like weights (the first messages much more often, as on a real bus)
+def synthetic_frames(dbc, messages, mix, seed):
+    rng = random.Random(seed)
+    chosen = list(dbc.messages)
+    rng.shuffle(chosen)
+    if messages:
+        chosen = chosen[:messages]
+    pools = [[can.Message(arbitration_id=message.frame_id, is_extended_id=message.is_extended_frame,
+                          data=synthetic_payload(message, rng))
+              for _ in range(PAYLOADS_PER_MESSAGE)]
+             for message in chosen]
+    weights = [1.0 / (rank + 1) for rank in range(len(pools))] if mix == "zipf" else None
+    return [rng.choice(pool) for pool in rng.choices(pools, weights=weights, k=SEQUENCE_LENGTH)]
+
+
+# Sends frames at `rate` frames/sec (0 = as fast as possible) for `duration` seconds; frames
+# the receiver's queue can't take are counted as dropped
+class Sender(threading.Thread):
+    def __init__(self, channel, frames, rate, duration):
+        super().__init__(daemon=True)
+        self.bus = can.Bus(interface="virtual", channel=channel)
+        self.frames = frames
+        self.rate = rate
+        self.duration = duration
+        self.sent = 0
+        self.dropped = 0
+
+    def run(self):
+        send = self.bus.send
+        frames = self.frames
+        start = time.perf_counter()
+        try:
+            while True:
+                elapsed = time.perf_counter() - start
+                if elapsed >= self.duration:
+                    break
+                due = int(self.rate * elapsed) if self.rate else self.sent + 256
+                while self.sent < due:
+                    try:
+                        send(frames[self.sent % len(frames)], timeout=0)
+                    except can.CanOperationError:
+                        self.dropped += 1
+                    self.sent += 1
+                if self.rate:
+                    time.sleep(SEND_TICK)
+        finally:
+            self.bus.shutdown()
+
+
+# Remembers the send timestamps of received frames until their batch is committed
+class LatencyBus:
+    def __init__(self, bus):
+        self.bus = bus
+        self.pending = []
+
+    def recv(self, timeout=None):
+        message = self.bus.recv(timeout)
+        if message is not None:
+            self.pending.append(message.timestamp)
+        return message
+
+
+# Without record_latency the timestamps are dropped (the logger run measures memory growth)
+class LatencyStore(SignalStore):
+    def __init__(self, keys, history_points, latency_bus, record_latency=True):
+        super().__init__(keys, history_points)
+        self.latency_bus = latency_bus
+        self.latencies = [] if record_latency else None
+
+    def commit_batch(self, batch):
+        super().commit_batch(batch)
+        pending = self.latency_bus.pending
+        if self.latencies is not None:
+            now = time.time()
+            self.latencies.extend(now - sent for sent in pending)
+        pending.clear()
+
+
+# The receive side of one run: a virtual bus with a bounded queue, the receive loop on its
+# own thread, committing into a latency-recording store
+class Receiver:
+    def __init__(self, channel, decoder_table, rx_queue, record_latency=True):
+        self.bus = can.Bus(interface="virtual", channel=channel, rx_queue_size=rx_queue)
+        self.latency_bus = LatencyBus(self.bus)
+        self.decoder_table = decoder_table
+        keys = signal_keys(decoder_table)
+        self.store = LatencyStore(keys, history_depth(len(keys)), self.latency_bus, record_latency)
+        self.stats = ReceiveStats()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        target = (self.decoder_table, self.store, FrameTiming(self.decoder_table))
+        receive_loop(self.latency_bus, lambda: target, self.stats, lambda: self.running)
+
+    @property
+    def received(self):
+        return self.stats.counters[ReceiveStats.FRAMES]
+
+    # Wait until everything the sender delivered is received (or the grace period ends)
+    def drain(self, expected):
+        deadline = time.perf_counter() + DRAIN_GRACE
+        while self.received < expected and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        self.running = False
+        self.thread.join()
+        self.bus.shutdown()
+
+
+# Sender and receiver running for one measurement; `during` runs on the calling thread
+def run_traffic(name, decoder_table, frames, rate, duration, rx_queue, during=None, record_latency=True):
+    channel = f"bench_e2e_{name}"
+    receiver = Receiver(channel, decoder_table, rx_queue, record_latency)
+    sender = Sender(channel, frames, rate, duration)
+    result = None
+    # The receive loop prints status lines and decode errors; they are part of the cost
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        start = time.perf_counter()
+        sender.start()
+        if during is not None:
+            result = during(receiver.store)
+        sender.join()
+        send_elapsed = time.perf_counter() - start
+        receiver.drain(sender.sent - sender.dropped)
+    summary = receiver.stats.stats()
+    traffic = {
+        "offered_rate": rate,
+        "duration_s": send_elapsed,
+        "sent": sender.sent,
+        "dropped": sender.dropped,
+        "received": summary["frames"],
+        "lost": sender.sent - sender.dropped - summary["frames"],
+        "decode_errors": summary["decode_errors"],
+        "throughput_fps": summary["frames"] / send_elapsed,
+        "mean_batch": summary["mean_batch"],
+        "max_batch": summary["max_batch"],
+        "latency_ms": percentiles(receiver.store.latencies or [], 1000.0)
+    }
+    return traffic, result
+
+
+# Concurrent pollers of /vehicle_data through the app's ASGI interface
+def poll_vehicle_data(generation, pollers, duration):
+    import httpx
+    import serverdbc
+
+    async def poller(client, latencies, stop_at):
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            response = await client.get("/vehicle_data")
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    async def run():
+        latencies = []
+        stop_at = time.perf_counter() + duration
+        transport = httpx.ASGITransport(app=serverdbc.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await asyncio.gather(*(poller(client, latencies, stop_at) for _ in range(pollers)))
+        return latencies
+
+    def during(store):
+        serverdbc.decoder_generation = generation._replace(store=store)
+        latencies = asyncio.run(run())
+        return {"pollers": pollers, "requests": len(latencies), "requests_per_s": len(latencies) / duration,
+                "latency_ms": percentiles(latencies, 1000.0)}
+
+    return during
+
+
+# Logs every signal at `interval` into a temporary file while tracing allocations
+def log_with_memory_trace(log_format, interval, duration):
+    def during(store):
+        samples = []
+        with tempfile.TemporaryDirectory() as directory:
+            tracemalloc.start()
+            try:
+                writer_class = LOG_WRITERS[log_format]
+                writer = writer_class(os.path.join(directory, f"bench{writer_class.extension}"), store.keys,
+                                      time.perf_counter_ns(), time.time())
+                recorder = ColumnarRecorder(store.keys, writer)
+                sampler = DeadlineSampler(interval)
+                get_row = make_row_getter(store, recorder.keys)
+                stop = threading.Event()
+                logger = threading.Thread(
+                    target=sampler.run,
+                    args=(lambda now_ns: recorder.record(now_ns, get_row(store.snapshot().values)), stop),
+                    daemon=True)
+                logger.start()
+                stop_at = time.perf_counter() + duration
+                while time.perf_counter() < stop_at:
+                    samples.append(tracemalloc.get_traced_memory()[0])
+                    time.sleep(MEMORY_SAMPLE_INTERVAL)
+                stop.set()
+                logger.join()
+                recorder.finish()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        # Growth between the end of the first second (buffers allocated) and the end
+        settled = samples[min(len(samples) - 1, int(1 / MEMORY_SAMPLE_INTERVAL))]
+        return {
+            "format": log_format,
+            "interval_ms": interval * 1000,
+            "rows": recorder.rows_recorded,
+            "buffer_bytes": recorder.buffer_bytes,
+            "traced_start_bytes": samples[0],
+            "traced_end_bytes": samples[-1],
+            "traced_peak_bytes": peak,
+            "growth_bytes_per_min": (samples[-1] - settled) * 60 / max(duration - 1, 1e-9),
+            "sampler": sampler.stats()
+        }
+
+    return during
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput/latency benchmark on the virtual bus")
+    parser.add_argument("--dbc", action="append", required=True, help="DBC file (repeatable)")
+    parser.add_argument("--rate", action="append", type=float,
+                        help="Offered frames/sec, repeatable; 0 = as fast as possible (default: 4000 and 0)")
+    parser.add_argument("--messages", type=int, default=0, help="Distinct DBC messages sent (0 = all)")
+    parser.add_argument("--mix", choices=("uniform", "zipf"), default="uniform", help="Message frequency mix")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per measurement")
+    parser.add_argument("--rx-queue", type=int, default=32768, help="Receive queue size in frames")
+    parser.add_argument("--pollers", type=int, default=8, help="Concurrent /vehicle_data pollers")
+    parser.add_argument("--log-format", choices=tuple(LOG_WRITERS), default="binary")
+    parser.add_argument("--log-interval-ms", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    args = parser.parse_args()
+    rates = args.rate or [4000.0, 0.0]
+
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        dbc = load_dbc(args.dbc, strict=True)
+    decoder_table = build_decoder_table(dbc)
+    frames = synthetic_frames(dbc, args.messages, args.mix, args.seed)
+    if not frames:
+        print("❌ The DBC files have no messages")
+        return 1
+
+    results = {
+        "config": {
+            "dbc": args.dbc, "messages": len({frame.arbitration_id for frame in frames}), "mix": args.mix,
+            "duration_s": args.duration, "rx_queue": args.rx_queue
+        },
+        "throughput": []
+    }
+    for rate in rates:
+        traffic, _ = run_traffic(f"rate{rate:g}", decoder_table, frames, rate, args.duration, args.rx_queue)
+        results["throughput"].append(traffic)
+        latency = traffic["latency_ms"]
+        print(f"Rate {rate or 'max':>6}: {traffic['throughput_fps']:,.0f} frames/sec received, "
+              f"{traffic['dropped']} dropped, {traffic['lost']} lost, latency p50 {latency.get('p50', 0):.2f} ms "
+              f"p99 {latency.get('p99', 0):.2f} ms", file=sys.stderr)
+
+    # Shaped like load_generation()'s (valid_can_ids per channel name); the store is set per poller run
+    config = ChannelConfig("", {"interface": "virtual"}, tuple(args.dbc))
+    generation = DecoderGeneration(
+        (Channel(config, dbc, decoder_table, FrameTiming(decoder_table)),),
+        {config.name: {msg.frame_id: msg.name for msg in dbc.messages}}, None, None)
+    traffic, polling = run_traffic("pollers", decoder_table, frames, rates[0], args.duration, args.rx_queue,
+                                   during=poll_vehicle_data(generation, args.pollers, args.duration))
+    results["vehicle_data"] = {**polling, "traffic": traffic}
+    print(f"/vehicle_data x{args.pollers}: {polling['requests_per_s']:,.0f} requests/sec, "
+          f"p50 {polling['latency_ms'].get('p50', 0):.2f} ms p99 {polling['latency_ms'].get('p99', 0):.2f} ms "
+          f"(receiving {traffic['throughput_fps']:,.0f} frames/sec)", file=sys.stderr)
+
+    traffic, logger = run_traffic("logger", decoder_table, frames, rates[0], args.duration, args.rx_queue,
+                                  during=log_with_memory_trace(args.log_format, args.log_interval_ms / 1000,
+                                                               args.duration),
+                                  record_latency=False)
+    results["logger"] = {**logger, "traffic": traffic}
+    print(f"Logger ({args.log_format}): {logger['rows']} rows, traced memory {logger['traced_start_bytes']:,} -> "
+          f"{logger['traced_end_bytes']:,} bytes (peak {logger['traced_peak_bytes']:,}), "
+          f"{logger['growth_bytes_per_min']:,.0f} bytes/min growth", file=sys.stderr)
+
+    output = orjson.dumps(results, option=orjson.OPT_INDENT_2)
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(output)
+    else:
+        sys.stdout.buffer.write(output + b"\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# Acceptance filter benchmark: what python-can software filters cost on an interface that
+# can't filter natively (PCAN, virtual), and how many foreign frame IDs each filter kind lets
+# through.
+#
+# 1. recv() cost: frames are queued on a python-can `virtual` channel (no native filtering,
+#    like pcan) and drained with no filters, with the DBC cover widened to 16 filters (what
+#    used to be installed everywhere) and with the exact cover (up to 512 filters).
+# 2. Leaks: of every 11-bit/29-bit ID not in the DBC (29-bit: a random sample), the share that
+#    the 16-filter cover and the PCAN hardware plan (can_filters.pcan_filter_plan) accept.
+#
+#   python benchmarks/bench_filters.py --dbc INV_CAN_cm.dbc [--random 150] [--frames 200000]
+#
+# Without --dbc, --random N standard frame IDs are drawn as the DBC.
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import can
+
+from acquisition import load_dbc
+from can_filters import MAX_FILTERS, acceptance_filters, dbc_frame_ids, pcan_filter_plan
+
+EXTENDED_SAMPLE = 200_000
+
+
+# Seconds per frame to drain `count` queued frames through bus.recv()
+def recv_cost(frames, count, filters):
+    channel = f"bench_filters_{len(filters) if filters else 0}"
+    bus = can.Bus(interface="virtual", channel=channel)
+    sender = can.Bus(interface="virtual", channel=channel)
+    try:
+        bus.set_filters(filters)
+        for index in range(count):
+            frame_id, extended = frames[index % len(frames)]
+            sender.send(can.Message(arbitration_id=frame_id, data=bytes(8), is_extended_id=extended))
+        recv = bus.recv
+        # recv(0) returns None when it filters a frame out, so drain until the virtual queue is empty
+        pending = bus.queue
+        start = time.perf_counter()
+        received = 0
+        while not pending.empty():
+            if recv(0) is not None:
+                received += 1
+        return (time.perf_counter() - start) / count, received
+    finally:
+        sender.shutdown()
+        bus.shutdown()
+
+
+def _matches(filters, frame_id, extended):
+    return any(f["extended"] == extended and (frame_id ^ f["can_id"]) & f["can_mask"] == 0 for f in filters)
+
+
+# Foreign IDs (not in the DBC) of one type and how many of them pass `accepts`
+def leaks(ids, extended, accepts):
+    if extended:
+        foreign = [frame_id for frame_id in random.Random(1).sample(range(0x20000000), EXTENDED_SAMPLE)
+                   if frame_id not in ids]
+    else:
+        foreign = [frame_id for frame_id in range(0x800) if frame_id not in ids]
+    return sum(1 for frame_id in foreign if accepts(frame_id, extended)), len(foreign)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Software vs hardware acceptance filter cost")
+    parser.add_argument("--dbc", action="append", help="DBC file (repeatable)")
+    parser.add_argument("--random", type=int, default=150, help="Random standard IDs when no DBC is given")
+    parser.add_argument("--frames", type=int, default=200_000, help="Frames queued per recv() run")
+    args = parser.parse_args()
+
+    if args.dbc:
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            standard_ids, extended_ids = dbc_frame_ids(load_dbc(args.dbc, strict=True))
+    else:
+        standard_ids, extended_ids = set(random.Random(0).sample(range(0x800), args.random)), set()
+    print(f"DBC: {len(standard_ids)} standard, {len(extended_ids)} extended frame IDs")
+
+    # Traffic: half DBC frames, half foreign standard IDs
+    known = [(frame_id, False) for frame_id in sorted(standard_ids)] + \
+            [(frame_id, True) for frame_id in sorted(extended_ids)]
+    foreign = [(frame_id, False) for frame_id in range(0x800) if frame_id not in standard_ids]
+    frames = [frame for pair in zip(known * (len(foreign) // len(known) + 1), foreign) for frame in pair]
+
+    widened = acceptance_filters(standard_ids, extended_ids, 16)
+    exact = acceptance_filters(standard_ids, extended_ids, MAX_FILTERS)
+    baseline, _ = recv_cost(frames, args.frames, None)
+    print(f"\nrecv() on an interface without native filtering, {args.frames} frames:")
+    print(f"  {'no filters':<28} {baseline * 1e6:6.2f} µs/frame")
+    for label, filters in (("16 widened software filters", widened), (f"{len(exact)} exact software filters", exact)):
+        cost, received = recv_cost(frames, args.frames, filters)
+        print(f"  {label:<28} {cost * 1e6:6.2f} µs/frame ({(cost - baseline) * 1e6:+.2f}), "
+              f"{received} of {args.frames} delivered")
+
+    plan = pcan_filter_plan(standard_ids, extended_ids)
+    print(f"\nForeign IDs accepted (29-bit: {EXTENDED_SAMPLE} sampled):")
+    for label, accepts in (("16 widened filters", lambda frame_id, extended: _matches(widened, frame_id, extended)),
+                           ("PCAN hardware plan", plan.accepts)):
+        counts = []
+        for ids, extended in ((standard_ids, False), (extended_ids, True)):
+            passed, total = leaks(ids, extended, accepts)
+            counts.append(f"{passed} of {total} {'29' if extended else '11'}-bit ({100 * passed / total:.1f}%)")
+        print(f"  {label:<20} {', '.join(counts)}")
+    print(f"  PCAN plan: {plan}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# Server startup benchmark: time until `uvicorn serverdbc:app` answers its first request
+# (/health, 503 while the DBC files load) and until it reports ready, plus the plain import
+# time of the serverdbc module. Each run starts a fresh server process.
+#
+#   python benchmarks/bench_first_response.py [--runs 5] [--mode thread|process]
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+POLL_INTERVAL = 0.01
+STARTUP_TIMEOUT = 60.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# HTTP status of /health, or None while nothing listens yet
+def health_status(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1.0) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+# Seconds until the first response and until /health returns 200
+def measure_startup(mode):
+    port = free_port()
+    env = {**os.environ, "CAN_ACQUISITION_MODE": mode}
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "serverdbc:app", "--port", str(port),
+                               "--log-level", "warning"],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_response = None
+    try:
+        while time.perf_counter() - start < STARTUP_TIMEOUT:
+            status = health_status(port)
+            now = time.perf_counter() - start
+            if status is not None and first_response is None:
+                first_response = now
+            if status == 200:
+                return first_response, now
+            if server.poll() is not None:
+                break
+            time.sleep(POLL_INTERVAL)
+        return first_response, None
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def measure_import():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import serverdbc"], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server time-to-first-response benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="Server starts to measure")
+    parser.add_argument("--mode", choices=("thread", "process"), default="thread", help="CAN_ACQUISITION_MODE")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    print(f"Import:          {min(imports) * 1000:.0f} ms best, {sum(imports) / len(imports) * 1000:.0f} ms mean "
+          f"(python -c 'import serverdbc', interpreter start included)")
+
+    results = [measure_startup(args.mode) for _ in range(args.runs)]
+    first = [result[0] for result in results if result[0] is not None]
+    ready = [result[1] for result in results if result[1] is not None]
+    if not first:
+        print("❌ The server never answered")
+        return 1
+    print(f"First response:  {min(first) * 1000:.0f} ms best, {sum(first) / len(first) * 1000:.0f} ms mean")
+    if ready:
+        print(f"Ready:           {min(ready) * 1000:.0f} ms best, {sum(ready) / len(ready) * 1000:.0f} ms mean")
+    if len(ready) < len(results):
+        print(f"⚠️ {len(results) - len(ready)} of {len(results)} runs never reported ready")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
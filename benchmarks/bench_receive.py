@@ -0,0 +1,125 @@
+# Receive-stage benchmark on the python-can `virtual` interface: the original per-frame
+# recv(0.1) / decode / commit loop versus the batched receive_loop() (drain pending frames,
+# decode, one store commit per batch).
+#
+# Frames (same sources as bench_decode.py) are queued on a virtual channel first, then each
+# variant drains them on one core. The achieved frame rate is compared with the frame rate
+# of a 100% loaded bus at 500 kbit/s and 1 Mbit/s for the same frame mix.
+#
+#   python benchmarks/bench_receive.py --dbc INV_CAN_cm.dbc --dbc NX0002.dbc [--frames trace.blf]
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import cantools
+import can
+
+from acquisition import ReceiveStats, receive_loop
+from bench_decode import LOG_DIRECTORY, load_keymetrics_frames, load_trace_frames
+from bus_health import FrameTiming
+from can_decoder import build_decoder_table, signal_keys
+from signal_store import SignalStore
+from signal_history import history_depth
+
+BITRATES = (500_000, 1_000_000)
+
+
+# Bits on the wire of a classic CAN data frame without stuffing (11-bit or 29-bit ID)
+def frame_bits(arbitration_id, data):
+    return (67 if arbitration_id > 0x7FF else 47) + 8 * len(data)
+
+
+def queue_frames(channel, frames, count):
+    sender = can.Bus(interface="virtual", channel=channel)
+    try:
+        for index in range(count):
+            arbitration_id, data = frames[index % len(frames)]
+            sender.send(can.Message(arbitration_id=arbitration_id, data=data,
+                                    is_extended_id=arbitration_id > 0x7FF))
+    finally:
+        sender.shutdown()
+
+
+# The original receive loop body: one recv(0.1), decode and commit per frame
+def receive_before(bus, decoder_table, store, count, stats):
+    while stats.counters[ReceiveStats.FRAMES] < count:
+        message = bus.recv(0.1)
+        if message:
+            stats.record(1, 0)
+            entry = decoder_table.get(message.arbitration_id)
+            if entry is not None:
+                try:
+                    decoded_data = entry.decode(message.data)
+                    store.commit(entry.slots, decoded_data.values(), time.monotonic())
+                    if message.arbitration_id % 50 == 0:
+                        print(f"📡 Received CAN ID: 0x{message.arbitration_id:X}, Message: {entry.message_name}")
+                except Exception as decode_error:
+                    print(f"⚠️ Error decoding message {entry.message_name}: {decode_error}")
+
+
+def receive_after(bus, decoder_table, store, count, stats):
+    timing = FrameTiming(decoder_table)
+    receive_loop(bus, lambda: (decoder_table, store, timing), stats,
+                 lambda: stats.counters[ReceiveStats.FRAMES] < count)
+
+
+# Frames/sec and CPU seconds of one variant draining `count` queued frames
+def measure(variant, decoder_table, frames, count):
+    channel = f"bench_{variant.__name__}"
+    bus = can.Bus(interface="virtual", channel=channel)
+    try:
+        queue_frames(channel, frames, count)
+        keys = signal_keys(decoder_table)
+        store = SignalStore(keys, history_depth(len(keys)))
+        stats = ReceiveStats()
+        # Console output is part of the cost being measured, but not worth reading
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            start = time.perf_counter()
+            start_cpu = time.thread_time()
+            variant(bus, decoder_table, store, count, stats)
+            cpu = time.thread_time() - start_cpu
+            elapsed = time.perf_counter() - start
+    finally:
+        bus.shutdown()
+    return count / elapsed, cpu, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive-loop benchmark on the virtual bus")
+    parser.add_argument("--dbc", action="append", required=True, help="DBC file (repeatable)")
+    parser.add_argument("--frames", help="Recorded trace readable by can.LogReader")
+    parser.add_argument("--logs", default=os.path.join(LOG_DIRECTORY, "keymetrics-*.csv"),
+                        help="Glob of keymetrics CSV logs used when no trace is given")
+    parser.add_argument("--count", type=int, default=200_000, help="Frames queued per variant")
+    args = parser.parse_args()
+
+    dbc = cantools.database.Database()
+    for dbc_path in args.dbc:
+        dbc.add_dbc_file(dbc_path)
+    decoder_table = build_decoder_table(dbc)
+
+    frames = load_trace_frames(args.frames) if args.frames else load_keymetrics_frames(dbc, args.logs)
+    if not frames:
+        print("❌ No frames to benchmark")
+        return 1
+
+    mean_bits = sum(frame_bits(*frame) for frame in frames) / len(frames)
+    print(f"Frames:  {args.count} queued ({len({f[0] for f in frames})} distinct IDs, {mean_bits:.0f} bits/frame)")
+    for bitrate in BITRATES:
+        print(f"100% load at {bitrate // 1000} kbit/s: {bitrate / mean_bits:,.0f} frames/sec")
+
+    for label, variant in (("Before", receive_before), ("After", receive_after)):
+        rate, cpu, stats = measure(variant, decoder_table, frames, args.count)
+        loads = ", ".join(f"{rate * mean_bits / bitrate:.0%} of {bitrate // 1000} kbit/s" for bitrate in BITRATES)
+        print(f"{label + ':':8} {rate:,.0f} frames/sec, {cpu:.2f} s CPU ({loads})")
+        summary = stats.stats()
+        print(f"         mean batch {summary['mean_batch']:.1f}, max batch {summary['max_batch']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# Replay a recorded trace (BLF/ASC/CSV/TRC or a .kmraw capture) through the receive loop and
+# signal store, as the server would receive it live. As fast as possible (--speed 0, the
+# default) it is a throughput benchmark; the digest of the final signal values makes it an
+# offline regression check (same trace + same DBC files -> same digest).
+#
+#   python benchmarks/bench_replay.py --dbc INV_CAN_cm.dbc --trace logs/trace.blf [--speed 0] [--filter]
+#
+# --filter installs the DBC's acceptance filters as python-can software filters (what the
+# servers avoid on interfaces without native filtering), to measure what they cost.
+import argparse
+import contextlib
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import orjson
+
+from acquisition import ReceiveStats, load_dbc, open_bus, receive_loop
+from bus_health import FrameTiming
+from can_decoder import build_decoder_table, signal_keys
+from can_filters import acceptance_filters, dbc_frame_ids
+from signal_history import history_depth
+from signal_store import SignalStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a CAN trace through the decode/store pipeline")
+    parser.add_argument("--dbc", action="append", required=True, help="DBC file (repeatable)")
+    parser.add_argument("--trace", required=True, help="Recorded trace: BLF, ASC, CSV, TRC or .kmraw")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="Replay speed: 1 = real time, 10 = 10x, 0 = as fast as possible")
+    parser.add_argument("--filter", action="store_true", help="Apply the DBC's acceptance filters in software")
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        dbc = load_dbc(args.dbc, strict=True)
+    decoder_table = build_decoder_table(dbc)
+    keys = signal_keys(decoder_table)
+    store = SignalStore(keys, history_depth(len(keys)))
+    timing = FrameTiming(decoder_table)
+    stats = ReceiveStats()
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        bus = open_bus({"interface": "replay", "channel": args.trace, "speed": args.speed})
+    if args.filter:
+        bus.set_filters(acceptance_filters(*dbc_frame_ids(dbc)))
+    try:
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            start = time.perf_counter()
+            start_cpu = time.thread_time()
+            receive_loop(bus, lambda: (decoder_table, store, timing), stats, lambda: not bus.finished)
+            cpu = time.thread_time() - start_cpu
+            elapsed = time.perf_counter() - start
+    finally:
+        bus.shutdown()
+
+    summary = stats.stats()
+    values = store.as_dict()
+    digest = hashlib.sha256(orjson.dumps(values, option=orjson.OPT_SORT_KEYS)).hexdigest()[:16]
+    print(f"Frames:  {summary['frames']} in {elapsed:.2f} s ({summary['frames'] / elapsed:,.0f} frames/sec, "
+          f"{cpu:.2f} s CPU)")
+    print(f"Batches: {summary['batches']} (mean {summary['mean_batch']:.1f}, max {summary['max_batch']}), "
+          f"decode errors: {summary['decode_errors']}")
+    print(f"Signals: {len(values)} of {len(store)} received, store generation {store.generation}")
+    print(f"Digest:  {digest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# DBC load benchmark: cold start (parse the DBC files and store the result in the cache)
+# versus warm start (load the parsed database from the content-hash cache), plus the
+# decoder table build that follows either one.
+#
+# Uses a temporary cache directory, so the server's cache is left alone.
+#
+#   python benchmarks/bench_startup.py --dbc INV_CAN_cm.dbc --dbc NX0002.dbc [--repeat 5]
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import dbc_cache
+from acquisition import load_dbc
+from can_decoder import build_decoder_table
+
+
+# Best wall time of `repeat` calls, running `before` (untimed) ahead of each one
+def best_time(function, repeat, before=None):
+    best = float("inf")
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold versus cached DBC load benchmark")
+    parser.add_argument("--dbc", action="append", required=True, help="DBC file (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    if dbc_cache.diskcache is None:
+        print("❌ diskcache is not installed, nothing to compare")
+        return 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        dbc_cache.DBC_CACHE_DIRECTORY = directory
+        cache = dbc_cache._get_cache()
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            cold = best_time(lambda: load_dbc(args.dbc), args.repeat, before=cache.clear)
+            warm = best_time(lambda: load_dbc(args.dbc), args.repeat)
+            dbc = load_dbc(args.dbc)
+            table = best_time(lambda: build_decoder_table(dbc), args.repeat)
+        cache.close()
+
+    print(f"DBC:     {len(dbc.messages)} messages, {sum(len(m.signals) for m in dbc.messages)} signals")
+    print(f"Cold:    {cold * 1000:.1f} ms (parse + cache write)")
+    print(f"Warm:    {warm * 1000:.1f} ms (cache read), {cold / warm:.1f}x faster")
+    print(f"Decoder table build: {table * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
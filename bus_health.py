@@ -0,0 +1,85 @@
+import time
+from array import array
+from typing import Any, Dict, Optional
+
+from can_decoder import FrameDecoder
+
+# Weight of the newest interval in the period and jitter averages (about the last 16 frames)
+ALPHA = 1 / 16
+
+
+# Per-frame-ID bus timing: frame count, smoothed period, jitter (smoothed absolute deviation
+# of the interval from the period), last-seen time and DLC mismatches against the DBC.
+#
+# State lives in two flat arrays indexed by the decoder table entries' rows, so observe()
+# is one call with a handful of array updates per frame and no allocation. The receive loop
+# is the only writer. In process mode the arrays are shared with the API process.
+# Intervals come from the frames' own timestamps (driver/hardware time where available);
+# ages assume the epoch-based timestamps python-can interfaces give.
+class FrameTiming:
+    def __init__(self, decoder_table: Dict[int, FrameDecoder], counters=None, times=None):
+        self.decoder_table = decoder_table
+        size = self.size = len(decoder_table)
+        counter_size, time_size = self.buffer_sizes(size)
+        # [count * n][dlc mismatches * n]
+        self.counters = counters if counters is not None else array('q', [0]) * counter_size
+        # [last timestamp * n][period * n][jitter * n]
+        self.times = times if times is not None else array('d', [0.0]) * time_size
+        # One view per field, so observe() indexes by row without offset arithmetic
+        counter_view = memoryview(self.counters).cast('B').cast('q')
+        time_view = memoryview(self.times).cast('B').cast('d')
+        self._count = counter_view[:size]
+        self._mismatches = counter_view[size:]
+        self._last = time_view[:size]
+        self._period = time_view[size:2 * size]
+        self._jitter = time_view[2 * size:]
+
+    @staticmethod
+    def buffer_sizes(size: int):
+        return 2 * size, 3 * size
+
+    # Receive loop: account one frame of a known ID
+    def observe(self, entry: FrameDecoder, message):
+        row = entry.row
+        self._count[row] += 1
+        if message.dlc != entry.length:
+            self._mismatches[row] += 1
+        timestamp = message.timestamp
+        last = self._last
+        previous = last[row]
+        last[row] = timestamp
+        if previous:
+            period = self._period[row]
+            if period:
+                deviation = timestamp - previous - period
+                self._period[row] = period + ALPHA * deviation
+                jitter = self._jitter
+                jitter[row] += ALPHA * (abs(deviation) - jitter[row])
+            else:
+                self._period[row] = timestamp - previous
+
+    # Timing of every frame ID seen so far, keyed "0x1A0"
+    def stats(self, now: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        if now is None:
+            now = time.time()
+        size = self.size
+        counters = list(self.counters)
+        times = list(self.times)
+        result = {}
+        for frame_id, entry in self.decoder_table.items():
+            row = entry.row
+            count = counters[row]
+            if not count:
+                continue
+            period = times[size + row]
+            result[f"0x{frame_id:X}"] = {
+                "message": entry.message_name,
+                "count": count,
+                "rate_hz": 1 / period if period > 0 else None,
+                "period_ms": period * 1000 if period else None,
+                "jitter_ms": times[2 * size + row] * 1000 if period else None,
+                "age_s": now - times[row],
+                "dlc_mismatches": counters[size + row],
+                "expected_dlc": entry.length
+            }
+        return result
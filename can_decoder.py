@@ -0,0 +1,75 @@
+import sys
+from functools import partial
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+# One entry of the decoder table: everything the receive loop needs for a frame ID,
+# prepared once per DBC load so the hot loop never formats strings or searches the database
+class FrameDecoder(NamedTuple):
+    message_name: str
+    decode: Callable[[bytes], Dict[str, Any]]
+    # Interned "Message.Signal" keys, in the order decode() returns the signals
+    keys: Tuple[str, ...]
+    # Signal store slots for the keys above
+    slots: Tuple[int, ...]
+    # Only set for multiplexed messages, where decode() returns a subset of the signals
+    key_map: Optional[Dict[str, int]]
+    # Index of this frame ID in the table, for per-frame-ID state kept in arrays
+    row: int
+    # Data length the DBC declares for the message
+    length: int
+    # Value descriptions (VAL_) of the message's signals that have them: slot -> {raw: label}
+    choices: Dict[int, Dict[int, str]]
+
+
+# Build the frame ID -> FrameDecoder table for a loaded cantools database.
+# Slots are assigned in DBC order, so the same files always produce the same layout.
+# A namespace (the channel name when several buses are acquired) prefixes every key as
+# "namespace.Message.Signal"; passing the same signal_slots dict to the tables of several
+# channels gives them disjoint slot ranges in one shared store.
+def build_decoder_table(dbc, namespace: str = "", signal_slots: Optional[Dict[str, int]] = None) -> Dict[int, FrameDecoder]:
+    table = {}
+    if signal_slots is None:
+        signal_slots = {}
+    prefix = f"{namespace}." if namespace else ""
+    for message in dbc.messages:
+        keys = tuple(sys.intern(f"{prefix}{message.name}.{sig.name}") for sig in message.signals)
+        slots = tuple(signal_slots.setdefault(key, len(signal_slots)) for key in keys)
+        key_map = None
+        if message.is_multiplexed():
+            key_map = {sig.name: slot for sig, slot in zip(message.signals, slots)}
+        # Choices are decoded to their raw numbers so every value fits the store's float buffer;
+        # their labels are kept here and applied when values are served or logged
+        decode = partial(message.decode, decode_choices=False)
+        choices = {slot: {raw: str(label) for raw, label in sig.choices.items()}
+                   for sig, slot in zip(message.signals, slots) if sig.choices}
+        previous = table.get(message.frame_id)
+        row = previous.row if previous is not None else len(table)
+        table[message.frame_id] = FrameDecoder(message.name, decode, keys, slots, key_map, row, message.length,
+                                               choices)
+    return table
+
+
+# Value descriptions of one or more decoder tables (sharing a slot assignment): slot -> {raw: label}
+def signal_choices(*decoder_tables: Dict[int, FrameDecoder]) -> Dict[int, Dict[int, str]]:
+    choices = {}
+    for decoder_table in decoder_tables:
+        for entry in decoder_table.values():
+            choices.update(entry.choices)
+    return choices
+
+
+# Signal keys of one or more decoder tables (sharing a slot assignment) indexed by slot,
+# used to lay out the signal store
+def signal_keys(*decoder_tables: Dict[int, FrameDecoder]) -> List[str]:
+    slot_keys = {}
+    for decoder_table in decoder_tables:
+        for entry in decoder_table.values():
+            slot_keys.update(zip(entry.slots, entry.keys))
+    return [slot_keys[slot] for slot in range(len(slot_keys))]
+
+
+# Slots for the decoded signals of a multiplexed message, where only the active branch is present
+def multiplexed_slots(entry: FrameDecoder, decoded: Dict[str, Any]) -> List[int]:
+    key_map = entry.key_map
+    return [key_map[name] for name in decoded]
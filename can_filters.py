@@ -0,0 +1,236 @@
+import contextlib
+import heapq
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+STANDARD_MASK = 0x7FF
+EXTENDED_MASK = 0x1FFFFFFF
+
+# Most ID/mask pairs each interface applies natively, in the kernel (socketcan: the
+# CAN_RAW_FILTER_MAX of a socket) or in the driver/hardware. Any other interface - and any
+# of these given more pairs - falls back to python-can's software filter, which tests every
+# pair in Python for every received frame (BusABC._matches_filters): more CPU than the
+# decoder table lookup that drops unknown IDs anyway, so no filters are installed there.
+# pcan is programmed directly (see pcan_filter_plan).
+NATIVE_FILTER_LIMITS = {"socketcan": 512, "vector": 2, "kvaser": 1}
+MAX_FILTERS = NATIVE_FILTER_LIMITS["socketcan"]
+
+
+# Exact cover of a set of IDs by (value, dont_care) cubes: Quine-McCluskey prime implicants,
+# then a greedy cover. Every cube matches only IDs from the set.
+def _exact_cubes(ids: Set[int], width: int) -> List[Tuple[int, int]]:
+    terms = {(frame_id, 0) for frame_id in ids}
+    primes = set()
+    while terms:
+        merged = set()
+        used = set()
+        for value, dont_care in terms:
+            for bit in range(width):
+                flag = 1 << bit
+                if dont_care & flag or value & flag:
+                    continue
+                partner = (value | flag, dont_care)
+                if partner in terms:
+                    merged.add((value, dont_care | flag))
+                    used.add((value, dont_care))
+                    used.add(partner)
+        primes.update(terms - used)
+        terms = merged
+
+    # Lazy greedy cover: a cube's gain only shrinks as IDs get covered, so a popped cube
+    # whose refreshed gain still beats the next best one is the best choice
+    covers = {cube: frozenset(frame_id for frame_id in ids if frame_id & ~cube[1] == cube[0]) for cube in primes}
+    heap = [(-len(cover), cube) for cube, cover in covers.items()]
+    heapq.heapify(heap)
+    cubes = []
+    uncovered = set(ids)
+    while uncovered:
+        _, cube = heapq.heappop(heap)
+        gain = len(covers[cube] & uncovered)
+        if not gain:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, cube))
+            continue
+        cubes.append(cube)
+        uncovered -= covers[cube]
+    return cubes
+
+
+# Merge the two cubes whose union is smallest until at most max_cubes remain
+def _widen(cubes: List[Tuple[int, int]], max_cubes: int) -> List[Tuple[int, int]]:
+    def union(a, b):
+        dont_care = a[1] | b[1] | (a[0] ^ b[0])
+        return a[0] & ~dont_care, dont_care
+
+    def size(cube):
+        return bin(cube[1]).count("1")
+
+    alive = set(cubes)
+    heap = [(size(union(a, b)), a, b) for index, a in enumerate(cubes) for b in cubes[index + 1:]]
+    heapq.heapify(heap)
+    while len(alive) > max(1, max_cubes):
+        _, a, b = heapq.heappop(heap)
+        # Pairs with an already merged cube are stale
+        if a not in alive or b not in alive:
+            continue
+        merged = union(a, b)
+        alive -= {a, b}
+        if merged not in alive:
+            for other in alive:
+                heapq.heappush(heap, (size(union(merged, other)), merged, other))
+            alive.add(merged)
+    return sorted(alive)
+
+
+# python-can can_filters accepting exactly the given standard and extended frame IDs
+# (widened to at most max_filters pairs). None - accept everything - when there is nothing
+# to filter on.
+def acceptance_filters(standard_ids: Iterable[int], extended_ids: Iterable[int] = (),
+                       max_filters: int = MAX_FILTERS) -> Optional[List[Dict]]:
+    standard_ids = set(standard_ids)
+    extended_ids = set(extended_ids)
+    if not standard_ids and not extended_ids:
+        return None
+    standard = _exact_cubes(standard_ids, 11)
+    extended = _exact_cubes(extended_ids, 29)
+    if len(standard) + len(extended) > max_filters:
+        # Split the budget in proportion, at least one pair per kind in use
+        standard_budget = max(1 if standard else 0, max_filters * len(standard) // (len(standard) + len(extended)))
+        extended_budget = max(1 if extended else 0, max_filters - standard_budget)
+        standard = _widen(standard, standard_budget) if standard else []
+        extended = _widen(extended, extended_budget) if extended else []
+    return ([{"can_id": value, "can_mask": STANDARD_MASK & ~dont_care, "extended": False}
+             for value, dont_care in standard] +
+            [{"can_id": value, "can_mask": EXTENDED_MASK & ~dont_care, "extended": True}
+             for value, dont_care in extended])
+
+
+# Standard and extended frame IDs of a loaded DBC, minus ignored frame IDs
+def dbc_frame_ids(dbc, ignored_ids: Iterable[int] = ()) -> Tuple[Set[int], Set[int]]:
+    ignored_ids = set(ignored_ids)
+    standard_ids = {msg.frame_id for msg in dbc.messages
+                    if not msg.is_extended_frame and msg.frame_id not in ignored_ids}
+    extended_ids = {msg.frame_id for msg in dbc.messages
+                    if msg.is_extended_frame and msg.frame_id not in ignored_ids}
+    return standard_ids, extended_ids
+
+
+# Filters for the messages of a loaded DBC, minus ignored frame IDs, on a bus of `interface`.
+# None (accept everything) where the interface can't apply them natively.
+def dbc_filters(dbc, ignored_ids: Iterable[int] = (), interface: Optional[str] = "socketcan") -> Optional[List[Dict]]:
+    max_filters = NATIVE_FILTER_LIMITS.get(interface)
+    if max_filters is None:
+        return None
+    standard_ids, extended_ids = dbc_frame_ids(dbc, ignored_ids)
+    if not standard_ids and not extended_ids and dbc.messages:
+        # Every DBC message is ignored: accept nothing we'd decode, but keep the bus usable
+        return [{"can_id": 0, "can_mask": EXTENDED_MASK, "extended": True}]
+    filters = acceptance_filters(standard_ids, extended_ids, max_filters)
+    # One pair per ID type is the least the cover can do; beyond the limit it'd be software
+    if filters is not None and len(filters) > max_filters:
+        return None
+    return filters
+
+
+# Smallest single (value, dont_care) cube matching every given ID
+def _enclosing_cube(ids: Set[int]) -> Tuple[int, int]:
+    first = next(iter(ids))
+    dont_care = 0
+    for frame_id in ids:
+        dont_care |= frame_id ^ first
+    return first & ~dont_care, dont_care
+
+
+# PCAN-Basic hardware filter settings for a set of frame IDs. PCAN has no list of ID/mask
+# pairs: each ID type has one acceptance code/mask in the CAN controller (SJA1000 style, a
+# 64-bit value with the code in the upper 32 bits and the mask - bits set = don't care - in
+# the lower 32), and the driver's message filter passes one ID range. Both are used: the
+# code/mask is the smallest pattern covering that type's IDs, and the range spans the IDs
+# when they are all of one type (a range can't separate the two types).
+class PcanFilterPlan(NamedTuple):
+    # 64-bit PCAN_ACCEPTANCE_FILTER_11BIT / _29BIT values
+    standard_code_mask: int
+    extended_code_mask: int
+    # (first ID, last ID, extended) for the message filter, or None to leave it open
+    id_range: Optional[Tuple[int, int, bool]]
+
+    # Whether a frame gets through to python-can (for measuring how tight the filter is)
+    def accepts(self, frame_id: int, extended: bool) -> bool:
+        code_mask = self.extended_code_mask if extended else self.standard_code_mask
+        code, dont_care = code_mask >> 32, code_mask & 0xFFFFFFFF
+        if (frame_id ^ code) & ~dont_care:
+            return False
+        if self.id_range is not None:
+            first, last, range_extended = self.id_range
+            return extended == range_extended and first <= frame_id <= last
+        return True
+
+
+# Open plan: every frame is received
+PCAN_OPEN = PcanFilterPlan(STANDARD_MASK, EXTENDED_MASK, None)
+
+
+def pcan_filter_plan(standard_ids: Set[int], extended_ids: Set[int]) -> PcanFilterPlan:
+    if not standard_ids and not extended_ids:
+        return PCAN_OPEN
+    codes = []
+    for ids, mask in ((standard_ids, STANDARD_MASK), (extended_ids, EXTENDED_MASK)):
+        # A type without IDs keeps an open pattern; the range below closes it
+        code, dont_care = _enclosing_cube(ids) if ids else (0, mask)
+        codes.append(code << 32 | dont_care)
+    id_range = None
+    if not extended_ids:
+        id_range = (min(standard_ids), max(standard_ids), False)
+    elif not standard_ids:
+        id_range = (min(extended_ids), max(extended_ids), True)
+    return PcanFilterPlan(codes[0], codes[1], id_range)
+
+
+def _program_pcan(bus, plan: PcanFilterPlan):
+    from can.interfaces.pcan import basic
+    pcan = bus.m_objPCANBasic
+    handle = bus.m_PcanHandle
+
+    def check(status, action):
+        if status != basic.PCAN_ERROR_OK:
+            raise RuntimeError(f"{action}: PCAN status 0x{int(status):X}")
+
+    check(pcan.SetValue(handle, basic.PCAN_ACCEPTANCE_FILTER_11BIT, plan.standard_code_mask),
+          "11-bit acceptance filter")
+    check(pcan.SetValue(handle, basic.PCAN_ACCEPTANCE_FILTER_29BIT, plan.extended_code_mask),
+          "29-bit acceptance filter")
+    if plan.id_range is None:
+        check(pcan.SetValue(handle, basic.PCAN_MESSAGE_FILTER, basic.PCAN_FILTER_OPEN), "message filter")
+    else:
+        first, last, extended = plan.id_range
+        check(pcan.SetValue(handle, basic.PCAN_MESSAGE_FILTER, basic.PCAN_FILTER_CLOSE), "message filter")
+        check(pcan.FilterMessages(handle, first, last,
+                                  basic.PCAN_MODE_EXTENDED if extended else basic.PCAN_MODE_STANDARD),
+              "message filter range")
+
+
+# Install the acceptance filters for a DBC's frame IDs (minus ignored IDs) on an open bus,
+# the way its interface filters natively; open_filter=True (raw capture, no DBC) lets every
+# frame through. Never installs python-can software filters. Returns a line for the log.
+def install_filters(bus, interface: Optional[str], dbc=None, ignored_ids: Iterable[int] = (),
+                    open_filter: bool = False) -> str:
+    if interface == "pcan":
+        plan = PCAN_OPEN if open_filter or dbc is None else pcan_filter_plan(*dbc_frame_ids(dbc, ignored_ids))
+        try:
+            _program_pcan(bus, plan)
+        except Exception as e:
+            # A half-programmed filter could drop frames we decode: fall back to receiving all
+            with contextlib.suppress(Exception):
+                _program_pcan(bus, PCAN_OPEN)
+            return f"PCAN hardware filter not set ({e}), receiving every frame"
+        if plan is PCAN_OPEN:
+            return "PCAN hardware filter open"
+        return (f"PCAN hardware filter: 11-bit 0x{plan.standard_code_mask:X}, 29-bit 0x{plan.extended_code_mask:X}, "
+                f"range {plan.id_range}")
+    filters = None if open_filter or dbc is None else dbc_filters(dbc, ignored_ids, interface)
+    bus.set_filters(filters)
+    if filters:
+        return f"{len(filters)} acceptance filters applied by {interface}"
+    if open_filter or dbc is None:
+        return "acceptance filters open"
+    return f"no acceptance filters ({interface} can only filter in software)"
@@ -0,0 +1,72 @@
+import hashlib
+import sys
+from typing import Optional, Sequence
+
+try:
+    import diskcache
+except ImportError:  # The cache is optional: without diskcache every load parses the files
+    diskcache = None
+
+DBC_CACHE_DIRECTORY = "./dbc_cache"
+DBC_CACHE_SIZE_LIMIT = 256 * 1024 * 1024
+# Bump when the cached value changes shape (or entries written before must not be trusted:
+# 2 drops partial databases cached by earlier versions)
+CACHE_FORMAT = 2
+
+_cache = None
+
+
+def _get_cache():
+    global _cache
+    if _cache is None and diskcache is not None:
+        _cache = diskcache.Cache(DBC_CACHE_DIRECTORY, size_limit=DBC_CACHE_SIZE_LIMIT)
+    return _cache
+
+
+# Cache key of a list of DBC files: a hash of their contents in load order (file names and
+# times don't matter), the cantools and Python versions. None if a file can't be read.
+def dbc_cache_key(dbc_paths: Sequence[str]) -> Optional[str]:
+    import cantools
+    digest = hashlib.sha256(f"{CACHE_FORMAT}:{getattr(cantools, '__version__', '')}:{sys.version_info[:2]}".encode())
+    return _hash_contents(digest, dbc_paths)
+
+
+# Identity of a list of DBC files, e.g. to tell which DBC a raw capture was recorded with: a
+# hash of their contents in load order only, so it survives cantools and Python upgrades.
+# None if a file can't be read.
+def dbc_digest(dbc_paths: Sequence[str]) -> Optional[str]:
+    return _hash_contents(hashlib.sha256(), dbc_paths)
+
+
+def _hash_contents(digest, dbc_paths: Sequence[str]) -> Optional[str]:
+    for dbc_path in dbc_paths:
+        try:
+            with open(dbc_path, "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+        digest.update(len(content).to_bytes(8, "little"))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+# Parsed database for a cache key, or None on a miss (or an unreadable entry)
+def read_cached_dbc(key: Optional[str]):
+    cache = _get_cache()
+    if cache is None or key is None:
+        return None
+    try:
+        return cache.get(key)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable DBC cache entry: {e}")
+        return None
+
+
+def write_cached_dbc(key: Optional[str], dbc):
+    cache = _get_cache()
+    if cache is None or key is None:
+        return
+    try:
+        cache.set(key, dbc)
+    except Exception as e:
+        print(f"⚠️ Could not cache parsed DBC: {e}")
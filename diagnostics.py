@@ -0,0 +1,155 @@
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# Recent error samples kept per process
+SAMPLE_RING_SIZE = 256
+# Per-key log rate limit: a burst of BURST messages, then one every 1/RATE_PER_S seconds
+RATE_PER_S = 1.0
+BURST = 5
+
+logger = logging.getLogger("can_api")
+_listener = None
+_listener_lock = threading.Lock()
+
+
+# Hands the record to the listener thread untouched; the default QueueHandler formats the
+# message in the calling thread, which is exactly the cost the receive loop must not pay
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+
+# Console output runs on a listener thread behind a queue, so a slow terminal never blocks
+# the thread that logs. Started on first use (importing this module has no side effects).
+def _start_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        log_queue = queue.SimpleQueue()
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        _listener = logging.handlers.QueueListener(log_queue, console)
+        _listener.start()
+        logger.addHandler(_DeferredQueueHandler(log_queue))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+# Token bucket per key. Messages over the limit are counted, and the count is reported with
+# the next message of that key that gets through.
+class RateLimiter:
+    def __init__(self, rate_per_s: float = RATE_PER_S, burst: int = BURST):
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self._buckets: Dict[Hashable, List[float]] = {}
+        self._lock = threading.Lock()
+
+    # (allowed, messages suppressed since the last allowed one)
+    def allow(self, key: Hashable):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_per_s)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                return False, 0
+            bucket[0] = tokens - 1
+            suppressed = int(bucket[2])
+            bucket[2] = 0
+            return True, suppressed
+
+
+_limiter = RateLimiter()
+
+
+# Log through the rate limiter. msg and args are %-formatted by the listener thread, and
+# only for messages that pass the limit.
+def log_limited(key: Hashable, level: int, msg: str, *args):
+    allowed, suppressed = _limiter.allow(key)
+    if not allowed:
+        return
+    if _listener is None:
+        _start_listener()
+    if suppressed:
+        msg += " (%d similar messages suppressed)"
+        args += (suppressed,)
+    logger.log(level, msg, *args)
+
+
+# "0x467" for a frame ID of the unnamed channel, "bms:0x467" with a channel name
+def format_error_key(key: Tuple[str, int]) -> str:
+    channel, frame_id = key
+    return f"{channel}:0x{frame_id:X}" if channel else f"0x{frame_id:X}"
+
+
+# Fixed-size ring of recent errors plus a count per (channel, frame ID), so the same ID on two
+# buses is kept apart. record() stores the payload and "Type: message" text, never the exception:
+# its traceback and chained exceptions would keep the decoder's and receive loop's frames (and
+# the store they reference) alive. Hex dumps are formatted when the API asks.
+class ErrorSamples:
+    def __init__(self, size: int = SAMPLE_RING_SIZE):
+        self.size = size
+        self.counts: Dict[Tuple[str, int], int] = {}
+        self._ring: List[Optional[tuple]] = [None] * size
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def record(self, channel: str, frame_id: int, data, error: BaseException):
+        key = (channel, frame_id)
+        sample = (time.time(), key, bytes(data), f"{type(error).__name__}: {error}")
+        with self._lock:
+            self._ring[self._next % self.size] = sample
+            self._next += 1
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _recent(self) -> List[tuple]:
+        with self._lock:
+            next_index = self._next
+            ring = list(self._ring)
+        count = min(next_index, self.size)
+        return [ring[index % self.size] for index in range(next_index - 1, next_index - 1 - count, -1)]
+
+    @staticmethod
+    def _format(sample) -> Dict[str, Any]:
+        timestamp, (channel, frame_id), data, error = sample
+        return {
+            "time": datetime.fromtimestamp(timestamp).isoformat(),
+            "channel": channel,
+            "frame_id": f"0x{frame_id:X}",
+            "data": data.hex(),
+            "error": error
+        }
+
+    # Recent samples, newest first
+    def samples(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [self._format(sample) for sample in self._recent()[:limit]]
+
+    # Count per key, with the latest error and payload while a sample is still in the ring
+    def summary(self, format_key=format_error_key) -> Dict[str, Dict[str, Any]]:
+        latest = {}
+        for sample in self._recent():
+            latest.setdefault(sample[1], sample)
+        result = {}
+        for key, count in list(self.counts.items()):
+            entry = {"count": count, "last_error": None, "data_sample": None}
+            sample = latest.get(key)
+            if sample is not None:
+                entry["last_error"] = sample[3]
+                entry["data_sample"] = sample[2].hex()
+            result[format_key(key)] = entry
+        return result
+
+
+# Decode failures of this process's receive loops
+DECODE_ERRORS = ErrorSamples()
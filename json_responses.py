@@ -0,0 +1,60 @@
+import threading
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response
+
+from metrics import SERIALISE_SECONDS
+
+# Entries kept per cache (one per distinct selection of signals)
+CACHE_SIZE = 64
+
+
+# Encoded JSON bodies of store snapshots, reused for as long as the store generation
+# hasn't advanced, so concurrent pollers share one encoding and unchanged data gets a 304.
+class SnapshotResponseCache:
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Hashable, Tuple[str, bytes]] = {}
+        self._lock = threading.Lock()
+
+    # (etag, body) for the store's current generation; build(snapshot) makes the payload
+    def encode(self, store, build: Callable, selection: Hashable = None) -> Tuple[str, bytes]:
+        etag = f'"{store.epoch}-{store.generation}"'
+        with self._lock:
+            cached = self._entries.get(selection)
+            if cached is not None and cached[0] == etag:
+                self.hits += 1
+                return cached
+        snapshot = store.snapshot()
+        # The snapshot may be newer than the generation read above; tag it with its own
+        etag = f'"{store.epoch}-{snapshot.generation}"'
+        with SERIALISE_SECONDS.labels("snapshot").time():
+            entry = (etag, orjson.dumps(build(snapshot)))
+        with self._lock:
+            self.misses += 1
+            if selection not in self._entries and len(self._entries) >= self.size:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[selection] = entry
+        return entry
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+# JSON response for a store snapshot, or 304 Not Modified if the client already has it
+def snapshot_response(request: Request, cache: SnapshotResponseCache, store,
+                      build: Optional[Callable] = None, selection: Hashable = None) -> Response:
+    if build is None:
+        build = store.as_dict
+    etag, body = cache.encode(store, build, selection)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,371 @@
+import csv
+import io
+import json
+import logging
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+from diagnostics import log_limited
+
+# Bytes per chunk and number of preallocated chunks; together they bound logger memory.
+# Rows per chunk follow from the row width (see chunk_rows()), within the row limits.
+CHUNK_BYTES = 256 * 1024
+MIN_CHUNK_ROWS = 16
+MAX_CHUNK_ROWS = 16384
+RING_CHUNKS = 4
+
+NAN = float("nan")
+
+
+# Rows per chunk for rows of `width` signals: a row is an int64 timestamp plus a float64 per
+# signal, so wide logs get short chunks and narrow ones long chunks of the same size
+def chunk_rows(width: int) -> int:
+    return max(MIN_CHUNK_ROWS, min(MAX_CHUNK_ROWS, CHUNK_BYTES // (8 * (1 + width))))
+
+
+# A preallocated block of log rows: int64 monotonic ns timestamps plus one float64 per signal.
+# Rows are written with a single slice assignment each; column c is the strided slice
+# values[c::width], so columns can be pulled out at flush time without a Python loop.
+class LogChunk:
+    def __init__(self, width: int, capacity: Optional[int] = None):
+        if capacity is None:
+            capacity = chunk_rows(width)
+        self.width = width
+        self.capacity = capacity
+        self.timestamps = array('q', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity * width))
+        self.rows = 0
+
+    def append(self, timestamp_ns: int, row: array):
+        rows = self.rows
+        self.timestamps[rows] = timestamp_ns
+        start = rows * self.width
+        self.values[start:start + self.width] = row
+        self.rows = rows + 1
+
+    def column(self, index: int) -> array:
+        return self.values[index:self.rows * self.width:self.width]
+
+    def row(self, index: int) -> array:
+        start = index * self.width
+        return self.values[start:start + self.width]
+
+
+# Build a function that pulls the logged signals out of a store snapshot as an array('d').
+# Keys the store doesn't know (e.g. after a DBC change) are recorded as NaN.
+def make_row_getter(store, keys: Sequence[str]) -> Callable[[array], array]:
+    if list(store.keys) == list(keys):
+        return lambda values: values
+    slots = [store.slots.get(key, -1) for key in keys]
+    if -1 in slots:
+        return lambda values: array('d', [values[slot] if slot >= 0 else NAN for slot in slots])
+    if len(slots) == 1:
+        slot = slots[0]
+        return lambda values: array('d', [values[slot]])
+    getter = itemgetter(*slots)
+    return lambda values: array('d', getter(values))
+
+
+# Format a logged value for CSV: empty for never-received signals, integers without ".0"
+def format_value(value: float) -> str:
+    if value != value:
+        return ""
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+# Build CSV rows (timestamp, elapsed_ms, values...) for a block of log rows. Columns in
+# `choices` ({column: {raw: label}}) are written as their value description when they have one.
+def csv_rows(timestamps: Sequence[int], rows: Iterable[Sequence[float]], start_ns: int,
+             start_wall: float, choices: Optional[Dict[int, Dict[float, str]]] = None) -> List[list]:
+    out = []
+    choices = choices or {}
+    for timestamp_ns, values in zip(timestamps, rows):
+        offset_ns = timestamp_ns - start_ns
+        timestamp = datetime.fromtimestamp(start_wall + offset_ns / 1e9).isoformat()
+        row = [timestamp, offset_ns // 1_000_000, *map(format_value, values)]
+        for column, labels in choices.items():
+            label = labels.get(values[column])
+            if label is not None:
+                row[2 + column] = label
+        out.append(row)
+    return out
+
+
+# Writes chunks to a keymetrics CSV file as they fill up, one batched writerows() per chunk
+class CsvChunkWriter:
+    extension = ".csv"
+
+    def __init__(self, filepath: str, keys: Sequence[str], start_ns: int, start_wall: float,
+                 choices: Optional[Dict[int, Dict[int, str]]] = None):
+        self.filepath = filepath
+        self.start_ns = start_ns
+        self.start_wall = start_wall
+        self.choices = choices
+        self._file = open(filepath, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(["timestamp", "elapsed_ms", *keys])
+
+    def write_chunk(self, chunk: LogChunk):
+        rows = (chunk.row(index) for index in range(chunk.rows))
+        self._writer.writerows(csv_rows(chunk.timestamps[:chunk.rows], rows, self.start_ns, self.start_wall,
+                                        self.choices))
+
+    # Flush and fsync so the file is complete on disk before the log is reported as saved
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+# Compact binary log of decoded signals (.kmlog):
+#   magic, uint32 header length, JSON header {keys, start_ns, start_wall, byteorder, choices},
+#   then per chunk: uint32 row count, int64[rows] monotonic ns timestamps,
+#   and one float64[rows] column per key.
+BINARY_MAGIC = b"KMLOG1\n"
+_COUNT = struct.Struct("<I")
+
+
+class BinaryChunkWriter:
+    extension = ".kmlog"
+
+    def __init__(self, filepath: str, keys: Sequence[str], start_ns: int, start_wall: float,
+                 choices: Optional[Dict[int, Dict[int, str]]] = None):
+        self.filepath = filepath
+        self._file = open(filepath, 'wb')
+        header = json.dumps({
+            "keys": list(keys),
+            "start_ns": start_ns,
+            "start_wall": start_wall,
+            "byteorder": sys.byteorder,
+            # Value descriptions by column, applied when the log is converted to CSV
+            "choices": {str(column): {str(raw): label for raw, label in labels.items()}
+                        for column, labels in (choices or {}).items()}
+        }).encode()
+        self._file.write(BINARY_MAGIC + _COUNT.pack(len(header)) + header)
+
+    def write_chunk(self, chunk: LogChunk):
+        write = self._file.write
+        write(_COUNT.pack(chunk.rows))
+        write(chunk.timestamps[:chunk.rows].tobytes())
+        for index in range(chunk.width):
+            write(chunk.column(index).tobytes())
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+# Read a .kmlog file: returns the header and an iterator of (timestamps, columns) per chunk
+def read_binary_log(filepath: str):
+    f = open(filepath, 'rb')
+    if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        f.close()
+        raise ValueError(f"{filepath} is not a binary keymetrics log")
+    (header_length,) = _COUNT.unpack(f.read(_COUNT.size))
+    header = json.loads(f.read(header_length))
+    swap = header["byteorder"] != sys.byteorder
+    width = len(header["keys"])
+
+    def read_array(typecode, rows):
+        values = array(typecode)
+        values.frombytes(f.read(rows * values.itemsize))
+        if swap:
+            values.byteswap()
+        return values
+
+    def chunks():
+        with f:
+            while True:
+                count = f.read(_COUNT.size)
+                if len(count) < _COUNT.size:
+                    return
+                (rows,) = _COUNT.unpack(count)
+                timestamps = read_array('q', rows)
+                columns = [read_array('d', rows) for _ in range(width)]
+                yield timestamps, columns
+
+    return header, chunks()
+
+
+# Stream a .kmlog file as CSV text, one chunk at a time, without materialising the log
+def iter_binary_log_as_csv(filepath: str) -> Iterator[str]:
+    header, chunks = read_binary_log(filepath)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["timestamp", "elapsed_ms", *header["keys"]])
+    choices = {int(column): {float(raw): label for raw, label in labels.items()}
+               for column, labels in header.get("choices", {}).items()}
+    for timestamps, columns in chunks:
+        writer.writerows(csv_rows(timestamps, zip(*columns), header["start_ns"], header["start_wall"], choices))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+# Writer class for each LoggingRequest format
+LOG_WRITERS = {
+    "csv": CsvChunkWriter,
+    "binary": BinaryChunkWriter
+}
+
+
+# Records signal rows into a fixed ring of chunks (sized by chunk_rows() unless chunk_rows is
+# given). Full chunks go through a bounded queue to
+# a writer thread, which writes them and hands them back to the ring, so memory stays at
+# RING_CHUNKS chunks however long the session runs and the recording thread never does file
+# I/O. If the writer falls a whole ring behind, record() waits for a free chunk, or with
+# blocking=False (used when the receive thread records) drops the row and counts it.
+class ColumnarRecorder:
+    def __init__(self, keys: Sequence[str], writer, rows_per_chunk: Optional[int] = None,
+                 ring_chunks: int = RING_CHUNKS, blocking: bool = True):
+        self.keys = list(keys)
+        if rows_per_chunk is None:
+            rows_per_chunk = chunk_rows(len(self.keys))
+        self.writer = writer
+        self.blocking = blocking
+        self.rows_recorded = 0
+        self.rows_dropped = 0
+        self.chunks_flushed = 0
+        self.error = None
+        self.buffer_bytes = ring_chunks * rows_per_chunk * 8 * (1 + len(self.keys))
+        self._free = queue.Queue()
+        for _ in range(ring_chunks):
+            self._free.put(LogChunk(len(self.keys), rows_per_chunk))
+        self._pending = queue.Queue(maxsize=ring_chunks)
+        self._current = self._free.get()
+        self._writer_thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self._writer_thread.start()
+
+    def _next_chunk(self):
+        if self.blocking:
+            return self._free.get()
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            return None
+
+    def record(self, timestamp_ns: int, row: array):
+        chunk = self._current
+        if chunk is None:
+            chunk = self._current = self._next_chunk()
+            if chunk is None:
+                self.rows_dropped += 1
+                return
+        chunk.append(timestamp_ns, row)
+        self.rows_recorded += 1
+        if chunk.rows == chunk.capacity:
+            self._pending.put(chunk)
+            self._current = self._next_chunk()
+
+    # Writer thread: write queued chunks until the None sentinel, then flush and close the file
+    def _write_chunks(self):
+        while True:
+            chunk = self._pending.get()
+            if chunk is None:
+                break
+            if self.error is None:
+                try:
+                    self.writer.write_chunk(chunk)
+                    self.chunks_flushed += 1
+                except Exception as e:
+                    # Keep draining so the sampling thread never blocks on a dead writer
+                    self.error = str(e)
+                    log_limited(("log_write", self.writer.filepath), logging.ERROR,
+                                "❌ Error writing log file %s: %s", self.writer.filepath, e)
+            chunk.rows = 0
+            self._free.put(chunk)
+        try:
+            self.writer.close()
+        except Exception as e:
+            self.error = self.error or str(e)
+            log_limited(("log_close", self.writer.filepath), logging.ERROR,
+                        "❌ Error closing log file %s: %s", self.writer.filepath, e)
+
+    @property
+    def filepath(self) -> str:
+        return self.writer.filepath
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending.qsize()
+
+    # Queue the partially filled last chunk and wait until the file is written and fsynced.
+    # At most RING_CHUNKS chunks can be pending, so this doesn't depend on session length.
+    def finish(self):
+        if self._current is not None and self._current.rows:
+            self._pending.put(self._current)
+        self._pending.put(None)
+        self._writer_thread.join()
+
+
+# Watch installed on one store: the recorder plus that store's slot -> column map
+class _StoreWatch(NamedTuple):
+    recorder: "ChangeRecorder"
+    columns: Dict[int, int]
+
+    def observe(self, slots, values, timestamp):
+        self.recorder.observe(self.columns, slots, values, timestamp)
+
+
+# On-change logging: watches the logged signals as the receive thread commits them and
+# records a row only when at least one of them moves by more than its deadband. Columns
+# that didn't change in that frame are left empty (NaN), so a row is a sparse record
+# stamped with the frame's receive time. Installed on a SignalStore as store.watch.
+class ChangeRecorder:
+    def __init__(self, recorder: ColumnarRecorder, deadbands: Optional[Dict[str, float]] = None):
+        self.recorder = recorder
+        deadbands = deadbands or {}
+        self.deadbands = array('d', [abs(deadbands.get(key, 0.0)) for key in recorder.keys])
+        self.last = array('d', [NAN]) * len(recorder.keys)
+        self._empty_row = array('d', [NAN]) * len(recorder.keys)
+
+    # Attach to a store (again whenever a new DBC is loaded). Each store gets its own column
+    # map, so commits still going to the previous store are mapped correctly until the swap.
+    def bind(self, store):
+        columns = {store.slots[key]: column for column, key in enumerate(self.recorder.keys)
+                   if key in store.slots}
+        store.watch = _StoreWatch(self, columns)
+
+    # Start the log with the current value of every logged signal
+    def seed(self, store):
+        row = make_row_getter(store, self.recorder.keys)(store.snapshot().values)
+        self.last = array('d', row)
+        if any(value == value for value in row):
+            self.recorder.record(time.perf_counter_ns(), array('d', row))
+
+    def unbind(self, store):
+        if store.watch is not None and store.watch.recorder is self:
+            store.watch = None
+
+    # Called through the store's watch from SignalStore.commit()/commit_batch() on the receive
+    # thread; timestamp is the frame's receive time (time.monotonic() clock), moved onto the
+    # log's perf_counter_ns() clock
+    def observe(self, columns, slots, values, timestamp: float):
+        last = self.last
+        deadbands = self.deadbands
+        row = None
+        for slot, value in zip(slots, values):
+            column = columns.get(slot)
+            if column is None:
+                continue
+            previous = last[column]
+            if value == previous or abs(value - previous) <= deadbands[column]:
+                continue
+            if row is None:
+                row = self._empty_row[:]
+            row[column] = value
+            last[column] = value
+        if row is not None:
+            self.recorder.record(int(timestamp * 1e9) + time.perf_counter_ns() - time.monotonic_ns(), row)
@@ -0,0 +1,285 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Windows (s) over which rates and percentiles are reported
+WINDOWS = (1, 10, 60)
+# How often the sampler thread snapshots every metric (s)
+SAMPLE_INTERVAL = 1.0
+
+# Histogram bucket upper bounds
+SECONDS_BUCKETS = (1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 5e-2, 0.1)
+FRAMES_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+# Monotonic counter. Every thread that increments it gets its own shard (an int64 array
+# only that thread writes), so increments need no lock; readers sum the shards.
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._local = threading.local()
+        self._shards: List[array] = []
+        self._lock = threading.Lock()
+
+    def _new_shard(self) -> array:
+        shard = array('q', [0])
+        self._local.shard = shard
+        with self._lock:
+            self._shards.append(shard)
+        return shard
+
+    def inc(self, amount: int = 1):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        shard[0] += amount
+
+    def totals(self) -> List[float]:
+        return [sum(shard[0] for shard in list(self._shards))]
+
+
+# Fixed-bucket histogram, sharded per thread like Counter. A shard holds one count per bucket
+# (the last one open-ended) followed by the sum of observed values.
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards: List[array] = []
+        self._lock = threading.Lock()
+
+    def _new_shard(self) -> array:
+        shard = array('d', [0.0]) * (len(self.buckets) + 2)
+        self._local.shard = shard
+        with self._lock:
+            self._shards.append(shard)
+        return shard
+
+    def observe(self, value: float):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    # Times the block it wraps (for request handlers; hot loops call observe() directly)
+    def time(self):
+        return _Timer(self)
+
+    # Bucket counts followed by the sum, over all shards
+    def totals(self) -> List[float]:
+        totals = [0.0] * (len(self.buckets) + 2)
+        for shard in list(self._shards):
+            for index, value in enumerate(shard):
+                totals[index] += value
+        return totals
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+# One histogram per label value (e.g. per frame ID), created on first use
+class HistogramFamily:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], label: str,
+                 format_label: Callable[[Any], str] = str):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label = label
+        self.format_label = format_label
+        self._children: Dict[Any, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value) -> Histogram:
+        child = self._children.get(value)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(value, Histogram(self.name, self.help, self.buckets))
+        return child
+
+    def children(self) -> List[Tuple[str, Histogram]]:
+        return [(self.format_label(value), child) for value, child in list(self._children.items())]
+
+
+# Window percentile from bucket count deltas: the upper bound of the bucket it falls in
+# (None in the open-ended bucket)
+def bucket_percentile(buckets: Sequence[float], counts: Sequence[float], fraction: float) -> Optional[float]:
+    total = sum(counts)
+    if not total:
+        return None
+    seen = 0
+    for index, count in enumerate(counts):
+        seen += count
+        if seen >= fraction * total:
+            return buckets[index] if index < len(buckets) else None
+    return None
+
+
+def _format_float(value: float) -> str:
+    return repr(float(value)) if value != int(value) or abs(value) >= 1e15 else str(int(value))
+
+
+# All metrics of the process. A sampler thread snapshots their totals every second; rates
+# and percentiles over the last 1/10/60 s are differences against those snapshots, so
+# nothing on the hot path keeps time windows.
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self._history = deque(maxlen=int(max(WINDOWS) / SAMPLE_INTERVAL) + 2)
+        self._sampler = None
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float]) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram_family(self, name: str, help: str, buckets: Sequence[float], label: str,
+                         format_label: Callable[[Any], str] = str) -> HistogramFamily:
+        metric = HistogramFamily(name, help, buckets, label, format_label)
+        self.metrics.append(metric)
+        return metric
+
+    # (metric, label value or None, series) for every series
+    def _series(self):
+        for metric in self.metrics:
+            if isinstance(metric, HistogramFamily):
+                for label_value, child in metric.children():
+                    yield metric, label_value, child
+            else:
+                yield metric, None, metric
+
+    def _totals(self) -> Dict[Tuple[str, Optional[str]], List[float]]:
+        return {(metric.name, label_value): series.totals() for metric, label_value, series in self._series()}
+
+    def sample(self):
+        self._history.append((time.monotonic(), self._totals()))
+
+    def start(self):
+        if self._sampler is not None:
+            return
+
+        def run():
+            while True:
+                self.sample()
+                time.sleep(SAMPLE_INTERVAL)
+
+        self._sampler = threading.Thread(target=run, name="metrics-sampler", daemon=True)
+        self._sampler.start()
+
+    # Snapshot at least `window` seconds old (or the oldest one) to difference against.
+    # The sampler thread appends while requests read, so iterate over a copy of the deque.
+    def _baseline(self, now: float, window: float):
+        baseline = None
+        for sampled_at, totals in reversed(list(self._history)):
+            baseline = (sampled_at, totals)
+            if sampled_at <= now - window:
+                break
+        return baseline
+
+    # Totals, windowed rates and (for histograms) windowed p50/p99/mean of every series
+    def summary(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        baselines = {window: self._baseline(now, window) for window in WINDOWS}
+        result: Dict[str, Any] = {}
+        for metric, label_value, series in self._series():
+            totals = series.totals()
+            entry: Dict[str, Any] = {}
+            if metric.kind == "counter":
+                entry["total"] = totals[0]
+            else:
+                entry["count"] = sum(totals[:-1])
+                entry["sum"] = totals[-1]
+            for window, baseline in baselines.items():
+                elapsed = now - baseline[0] if baseline else 0.0
+                previous = baseline[1].get((metric.name, label_value)) if baseline else None
+                if previous is None:
+                    previous = [0.0] * len(totals)
+                delta = [current - before for current, before in zip(totals, previous)]
+                if metric.kind == "counter":
+                    entry[f"rate_{window}s"] = delta[0] / elapsed if elapsed > 0 else 0.0
+                else:
+                    count = sum(delta[:-1])
+                    entry[f"rate_{window}s"] = count / elapsed if elapsed > 0 else 0.0
+                    entry[f"mean_{window}s"] = delta[-1] / count if count else None
+                    entry[f"p50_{window}s"] = bucket_percentile(metric.buckets, delta[:-1], 0.5)
+                    entry[f"p99_{window}s"] = bucket_percentile(metric.buckets, delta[:-1], 0.99)
+            if label_value is None:
+                result[metric.name] = entry
+            else:
+                result.setdefault(metric.name, {})[label_value] = entry
+        return result
+
+    # Prometheus text exposition format (version 0.0.4)
+    def prometheus_text(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if metric.kind == "counter":
+                lines.append(f"{metric.name} {_format_float(metric.totals()[0])}")
+                continue
+            if isinstance(metric, HistogramFamily):
+                series = [(f'{metric.label}="{label_value}"', child) for label_value, child in metric.children()]
+            else:
+                series = [("", metric)]
+            for labels, histogram in series:
+                totals = histogram.totals()
+                separator = "," if labels else ""
+                cumulative = 0.0
+                for bound, count in zip(metric.buckets, totals):
+                    cumulative += count
+                    lines.append(f'{metric.name}_bucket{{{labels}{separator}le="{bound!r}"}} {_format_float(cumulative)}')
+                cumulative += totals[len(metric.buckets)]
+                lines.append(f'{metric.name}_bucket{{{labels}{separator}le="+Inf"}} {_format_float(cumulative)}')
+                label_set = f"{{{labels}}}" if labels else ""
+                lines.append(f"{metric.name}_sum{label_set} {_format_float(totals[-1])}")
+                lines.append(f"{metric.name}_count{label_set} {_format_float(cumulative)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Hot-path metrics shared by the receive loops, the logger and the API
+DECODE_SECONDS = REGISTRY.histogram_family(
+    "can_decode_seconds", "Time to decode one frame, per frame ID", SECONDS_BUCKETS, "frame_id",
+    lambda frame_id: f"0x{frame_id:X}")
+RECV_QUEUE_DEPTH = REGISTRY.histogram(
+    "can_recv_queue_depth", "Frames pending when the receive loop drained the bus (batch size)", FRAMES_BUCKETS)
+COMMIT_SECONDS = REGISTRY.histogram(
+    "can_store_commit_seconds", "Time to commit one decoded batch to the signal store", SECONDS_BUCKETS)
+LOGGER_TICK_SECONDS = REGISTRY.histogram(
+    "logger_tick_seconds", "Work time of one logger sampling tick", SECONDS_BUCKETS)
+LOGGER_TICK_OVERRUNS = REGISTRY.counter(
+    "logger_tick_overruns_total", "Logger ticks whose work took longer than the interval")
+FRAMES_RECEIVED = REGISTRY.counter("can_frames_received_total", "CAN frames received")
+FRAMES_DECODED = REGISTRY.counter("can_frames_decoded_total", "CAN frames decoded into the signal store")
+FRAMES_IGNORED = REGISTRY.counter("can_frames_ignored_total", "CAN frames skipped as ignored or quarantined")
+BATCHES = REGISTRY.counter("can_receive_batches_total", "Batches drained from the CAN bus")
+SERIALISE_SECONDS = REGISTRY.histogram_family(
+    "http_serialise_seconds", "Time to serialise a JSON response body", SECONDS_BUCKETS, "endpoint")
@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+from diagnostics import log_limited
+
+# Decode failures of one frame ID within FAILURE_WINDOW (s) that quarantine it
+FAILURE_THRESHOLD = 50
+FAILURE_WINDOW = 10.0
+# First quarantine period (s); doubled each time the ID fails again while probed, up to MAX_BACKOFF
+INITIAL_BACKOFF = 5.0
+MAX_BACKOFF = 300.0
+
+
+# Frame IDs the receive loop skips without decoding: IDs ignored by hand, and IDs quarantined
+# automatically because their decode keeps failing (usually a message definition that doesn't
+# match the frames on the bus).
+#
+# The receive loop reads `skip`, a frozenset that is replaced (never mutated) on every change,
+# once per batch and again when failed() quarantines an ID, so the per-frame check is one set
+# lookup and no lock. Only the failure path (failed()) and tick(), once per batch, do any
+# bookkeeping.
+#
+# A quarantined ID is released after its backoff and probed: its frames are decoded again,
+# and a failure within FAILURE_WINDOW of the release quarantines it again for twice as long.
+# An ID that gets through the probe window starts over from INITIAL_BACKOFF next time.
+# All times are time.monotonic().
+class FrameQuarantine:
+    def __init__(self, ignored: Iterable[int] = ()):
+        self._ignored = set(ignored)
+        # frame ID -> [release time, backoff, quarantines so far]
+        self._quarantined: Dict[int, List[float]] = {}
+        # frame ID -> [probe end, backoff, quarantines so far]
+        self._probing: Dict[int, List[float]] = {}
+        # frame ID -> [window start, failures in window]
+        self._failures: Dict[int, List[float]] = {}
+        self._next_release = float("inf")
+        self._lock = threading.Lock()
+        self.skip: FrozenSet[int] = frozenset(self._ignored)
+
+    # Manually ignored IDs (for acceptance filters: these never need to reach Python)
+    @property
+    def ignored(self) -> List[int]:
+        return sorted(self._ignored)
+
+    def _publish(self):
+        self.skip = frozenset(self._ignored.union(self._quarantined))
+        self._next_release = min((entry[0] for entry in self._quarantined.values()), default=float("inf"))
+
+    def _quarantine(self, frame_id: int, now: float, backoff: float, quarantines: int):
+        self._failures.pop(frame_id, None)
+        self._quarantined[frame_id] = [now + backoff, backoff, quarantines + 1]
+        self._publish()
+        log_limited(("quarantine", frame_id), logging.WARNING,
+                    "🚧 Quarantined frame ID 0x%X for %.0f s after repeated decode failures", frame_id, backoff)
+
+    # Receive loop: a frame of this ID failed to decode. True if that quarantined it.
+    def failed(self, frame_id: int, now: float) -> bool:
+        with self._lock:
+            if frame_id in self._quarantined:
+                return False
+            probe = self._probing.pop(frame_id, None)
+            if probe is not None and now < probe[0]:
+                self._quarantine(frame_id, now, min(probe[1] * 2, MAX_BACKOFF), probe[2])
+                return True
+            window = self._failures.get(frame_id)
+            if window is None or now - window[0] > FAILURE_WINDOW:
+                window = self._failures[frame_id] = [now, 0]
+            window[1] += 1
+            if window[1] >= FAILURE_THRESHOLD:
+                self._quarantine(frame_id, now, INITIAL_BACKOFF, probe[2] if probe is not None else 0)
+                return True
+        return False
+
+    # Receive loop, once per batch: release the IDs whose backoff is over, for probing
+    def tick(self, now: float):
+        if now < self._next_release:
+            return
+        with self._lock:
+            for frame_id, (release, backoff, quarantines) in list(self._quarantined.items()):
+                if release <= now:
+                    del self._quarantined[frame_id]
+                    self._probing[frame_id] = [now + FAILURE_WINDOW, backoff, quarantines]
+                    log_limited(("quarantine", frame_id), logging.INFO,
+                                "🔁 Probing quarantined frame ID 0x%X again", frame_id)
+            self._publish()
+
+    # API: skip an ID until it's released by hand
+    def ignore(self, frame_id: int) -> bool:
+        with self._lock:
+            if frame_id in self._ignored:
+                return False
+            self._ignored.add(frame_id)
+            self._publish()
+            return True
+
+    # API: decode an ID again, whether it was ignored by hand or quarantined. Its failure
+    # history is forgotten.
+    def release(self, frame_id: int) -> bool:
+        with self._lock:
+            changed = frame_id in self._ignored or frame_id in self._quarantined
+            self._ignored.discard(frame_id)
+            self._quarantined.pop(frame_id, None)
+            self._probing.pop(frame_id, None)
+            self._failures.pop(frame_id, None)
+            self._publish()
+            return changed
+
+    def status(self, now: Optional[float] = None) -> Dict[str, Any]:
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            return {
+                "ignored": [f"0x{frame_id:X}" for frame_id in sorted(self._ignored)],
+                "quarantined": {f"0x{frame_id:X}": {
+                    "release_in_s": release - now,
+                    "backoff_s": backoff,
+                    "quarantines": quarantines
+                } for frame_id, (release, backoff, quarantines) in sorted(self._quarantined.items())},
+                "probing": {f"0x{frame_id:X}": {
+                    "probe_ends_in_s": probe_end - now,
+                    "backoff_s": backoff,
+                    "quarantines": quarantines
+                } for frame_id, (probe_end, backoff, quarantines) in sorted(self._probing.items())
+                    if probe_end > now},
+                "threshold": {"failures": FAILURE_THRESHOLD, "window_s": FAILURE_WINDOW}
+            }
+
+
+# Frame ID from the API: "0x467" or "1127"
+def parse_frame_id(value: str) -> int:
+    return int(value, 16) if value.lower().startswith("0x") else int(value)
@@ -0,0 +1,202 @@
+import csv
+import io
+import json
+import os
+import struct
+import threading
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Sequence
+
+from can_decoder import FrameDecoder, multiplexed_slots, signal_choices, signal_keys
+from dbc_cache import dbc_digest
+from log_recorder import format_value
+
+# One fixed-size record per frame: timestamp (s), arbitration ID, DLC, flags, 8 data bytes.
+# Our buses are classic CAN; longer (FD) payloads are truncated and flagged.
+RECORD = struct.Struct("<dIBB8s2x")
+FLAG_EXTENDED = 0x01
+FLAG_REMOTE = 0x02
+FLAG_ERROR = 0x04
+FLAG_TRUNCATED = 0x08
+
+# Ring capacity in frames (~1.5 MB, several seconds of a fully loaded 1 Mbit/s bus)
+RING_FRAMES = 65536
+# How often the drain thread moves frames from the ring to disk
+DRAIN_INTERVAL = 0.05
+
+RAW_MAGIC = b"KMRAW1\n"
+_COUNT = struct.Struct("<I")
+
+
+# Raw frame capture for a logging session (.kmraw). The header records the DBC files and a
+# digest of their contents, so an export can tell whether the loaded DBC still matches.
+#
+# The receive thread only packs each frame into a preallocated ring (append()); a drain
+# thread copies whole spans of the ring to the file. Nothing is decoded while capturing:
+# decoding happens at export time with the loaded DBC. Head and tail are ever-increasing
+# frame counters; with a single producer and a single consumer no lock is needed. If the
+# drain thread ever falls a full ring behind, frames are counted in `dropped` instead of
+# blocking the receive thread.
+class RawCapture:
+    extension = ".kmraw"
+
+    def __init__(self, filepath: str, start_wall: float, dbc_files: List[str],
+                 capacity: int = RING_FRAMES):
+        self.filepath = filepath
+        self.capacity = capacity
+        self.buffer_bytes = capacity * RECORD.size
+        self.rows_recorded = 0
+        self.chunks_flushed = 0
+        self.dropped = 0
+        self.error = None
+        self._ring = bytearray(self.buffer_bytes)
+        self._head = 0
+        self._tail = 0
+        self._stop = threading.Event()
+        self._file = open(filepath, 'wb')
+        header = json.dumps({"start_wall": start_wall, "dbc_files": list(dbc_files),
+                             "dbc_digest": dbc_digest(dbc_files)}).encode()
+        self._file.write(RAW_MAGIC + _COUNT.pack(len(header)) + header)
+        self._drain_thread = threading.Thread(target=self._drain_loop, daemon=True)
+        self._drain_thread.start()
+
+    # Receive thread: pack one python-can Message into the ring
+    def append(self, message):
+        head = self._head
+        if head - self._tail >= self.capacity:
+            self.dropped += 1
+            return
+        flags = 0
+        if message.is_extended_id:
+            flags |= FLAG_EXTENDED
+        if message.is_remote_frame:
+            flags |= FLAG_REMOTE
+        if message.is_error_frame:
+            flags |= FLAG_ERROR
+        data = message.data
+        if len(data) > 8:
+            flags |= FLAG_TRUNCATED
+            data = bytes(data[:8])
+        RECORD.pack_into(self._ring, (head % self.capacity) * RECORD.size,
+                         message.timestamp, message.arbitration_id, message.dlc, flags, bytes(data))
+        self._head = head + 1
+
+    @property
+    def queue_depth(self) -> int:
+        return self._head - self._tail
+
+    # Drain thread: copy everything between tail and head to the file
+    def _drain(self):
+        head = self._head
+        tail = self._tail
+        if head == tail:
+            return
+        start = (tail % self.capacity) * RECORD.size
+        end = (head % self.capacity) * RECORD.size
+        try:
+            if start < end:
+                self._file.write(self._ring[start:end])
+            else:
+                self._file.write(self._ring[start:])
+                self._file.write(self._ring[:end])
+        except Exception as e:
+            if self.error is None:
+                self.error = str(e)
+                print(f"❌ Error writing raw capture: {e}")
+        self._tail = head
+        self.rows_recorded += head - tail
+        self.chunks_flushed += 1
+
+    def _drain_loop(self):
+        while not self._stop.wait(DRAIN_INTERVAL):
+            self._drain()
+
+    # Stop draining, write what is left and fsync the file
+    def finish(self):
+        self._stop.set()
+        self._drain_thread.join()
+        self._drain()
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+
+
+# Read a .kmraw file: returns the header and an iterator over blocks of unpacked records
+def read_raw_log(filepath: str, frames_per_block: int = 4096):
+    f = open(filepath, 'rb')
+    if f.read(len(RAW_MAGIC)) != RAW_MAGIC:
+        f.close()
+        raise ValueError(f"{filepath} is not a raw keymetrics capture")
+    (header_length,) = _COUNT.unpack(f.read(_COUNT.size))
+    header = json.loads(f.read(header_length))
+
+    def blocks():
+        with f:
+            while True:
+                block = f.read(frames_per_block * RECORD.size)
+                usable = len(block) - len(block) % RECORD.size
+                if not usable:
+                    return
+                yield RECORD.iter_unpack(block[:usable])
+
+    return header, blocks()
+
+
+# Decode a .kmraw capture offline and stream it as keymetrics CSV: one row per decoded
+# frame holding the latest value of every signal (sample-and-hold), so the file has the
+# same shape as a sampled log but with every frame's timing. Value-described signals are
+# written as their label, like the other logs. `decoder_table` must be built from
+# `dbc_files`; a capture recorded with other DBC contents raises ValueError here, before
+# anything is streamed (captures from before the digest was recorded can't be checked).
+def iter_raw_log_as_csv(filepath: str, decoder_table: Dict[int, FrameDecoder],
+                        dbc_files: Sequence[str]) -> Iterator[str]:
+    header, blocks = read_raw_log(filepath)
+    recorded = header.get("dbc_digest")
+    if recorded is not None and recorded != dbc_digest(dbc_files):
+        blocks.close()
+        raise ValueError(f"{os.path.basename(filepath)} was recorded with other DBC files "
+                         f"({', '.join(header['dbc_files'])}) than the ones loaded now")
+    return _raw_rows_as_csv(header["start_wall"], blocks, decoder_table)
+
+
+def _raw_rows_as_csv(start_wall: float, blocks, decoder_table: Dict[int, FrameDecoder]) -> Iterator[str]:
+    keys = signal_keys(decoder_table)
+    choices = signal_choices(decoder_table)
+    values = array('d', [float("nan")]) * len(keys)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["timestamp", "elapsed_ms", "can_id", *keys])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for block in blocks:
+        rows = []
+        for timestamp, arbitration_id, dlc, flags, data in block:
+            if flags & (FLAG_REMOTE | FLAG_ERROR):
+                continue
+            entry = decoder_table.get(arbitration_id)
+            if entry is None:
+                continue
+            try:
+                decoded = entry.decode(data[:dlc])
+            except Exception:
+                continue
+            slots = entry.slots if entry.key_map is None else multiplexed_slots(entry, decoded)
+            for slot, value in zip(slots, decoded.values()):
+                values[slot] = value
+            row = [datetime.fromtimestamp(timestamp).isoformat(),
+                   int((timestamp - start_wall) * 1000),
+                   f"0x{arbitration_id:X}",
+                   *map(format_value, values)]
+            for slot, labels in choices.items():
+                label = labels.get(values[slot])
+                if label is not None:
+                    row[3 + slot] = label
+            rows.append(row)
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
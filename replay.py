@@ -0,0 +1,90 @@
+import time
+from typing import Iterator, Optional
+
+import can
+
+from raw_capture import FLAG_ERROR, FLAG_EXTENDED, FLAG_REMOTE, read_raw_log
+
+# Sleep while a finished (non-looping) replay is polled without a timeout (s)
+IDLE_SLEEP = 0.1
+
+
+# python-can Messages of a .kmraw capture
+def iter_raw_log_messages(filepath: str) -> Iterator[can.Message]:
+    _, blocks = read_raw_log(filepath)
+    for block in blocks:
+        for timestamp, arbitration_id, dlc, flags, data in block:
+            yield can.Message(timestamp=timestamp, arbitration_id=arbitration_id,
+                              is_extended_id=bool(flags & FLAG_EXTENDED),
+                              is_remote_frame=bool(flags & FLAG_REMOTE),
+                              is_error_frame=bool(flags & FLAG_ERROR),
+                              dlc=dlc, data=data[:min(dlc, 8)])
+
+
+# Frames of a recorded trace: our own raw captures, or anything can.LogReader reads
+# (BLF, ASC, CSV, TRC, ...)
+def read_trace(filepath: str) -> Iterator[can.Message]:
+    if filepath.endswith(".kmraw"):
+        return iter_raw_log_messages(filepath)
+    return iter(can.LogReader(filepath))
+
+
+# A python-can bus that plays a recorded trace, so the receive loop, store and loggers run
+# without hardware. Frames are released on the trace's own timing scaled by `speed`
+# (1.0 = real time, 10.0 = ten times faster, 0 = as fast as possible), and stamped with the
+# wall time at which they are released, like live frames. With loop=True the trace restarts
+# when it ends; otherwise the bus goes idle and `finished` becomes True.
+#
+# Acceptance filters are applied in software, as on interfaces without hardware filtering.
+class ReplayBus(can.BusABC):
+    def __init__(self, channel: str, speed: float = 1.0, loop: bool = False, can_filters=None, **kwargs):
+        super().__init__(channel, can_filters=can_filters, **kwargs)
+        self.channel_info = f"Replay of {channel}"
+        self.filepath = channel
+        self.speed = speed
+        self.loop = loop
+        self.finished = False
+        self.frames_replayed = 0
+        self._restart()
+
+    def _restart(self):
+        self._frames = read_trace(self.filepath)
+        self._pending: Optional[can.Message] = None
+        self._first_timestamp = None
+        self._start = time.perf_counter()
+
+    def _recv_internal(self, timeout):
+        # Frames the filters reject are skipped here, so they cost no wait and don't end a batch
+        while self._pending is None:
+            self._pending = next(self._frames, None)
+            if self._pending is None:
+                if self.loop and self.frames_replayed:
+                    self._restart()
+                    return None, False
+                self.finished = True
+                time.sleep(IDLE_SLEEP if timeout is None else timeout)
+                return None, False
+            if not self._matches_filters(self._pending):
+                self._pending = None
+                continue
+            if self._first_timestamp is None:
+                self._first_timestamp = self._pending.timestamp
+                self._start = time.perf_counter()
+
+        if self.speed:
+            due = self._start + (self._pending.timestamp - self._first_timestamp) / self.speed
+            wait = due - time.perf_counter()
+            if wait > 0:
+                if timeout is not None and wait > timeout:
+                    time.sleep(timeout)
+                    return None, False
+                time.sleep(wait)
+
+        message = self._pending
+        self._pending = None
+        message.timestamp = time.time()
+        self.frames_replayed += 1
+        return message, True
+
+    def send(self, msg, timeout=None):
+        raise can.CanError("A replay bus can't send frames")
@@ -0,0 +1,99 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict
+
+from metrics import LOGGER_TICK_OVERRUNS, LOGGER_TICK_SECONDS
+
+# Upper bounds (µs) of the tick lateness histogram buckets; the last bucket is open-ended
+JITTER_BUCKETS_US = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+
+
+# Runs tick(now_ns) on an absolute perf_counter_ns() grid: deadline k is start + k * interval,
+# so the period never drifts with the work or sleep overshoot. A tick that starts more than a
+# whole interval late skips the deadlines it missed (counted in missed_ticks) instead of
+# firing a burst of back-to-back samples.
+class DeadlineSampler:
+    def __init__(self, interval_s: float):
+        self.interval_ns = max(1, int(interval_s * 1e9))
+        self.ticks = 0
+        self.missed_ticks = 0
+        # Ticks whose own work took longer than the interval
+        self.overruns = 0
+        self.start_ns = 0
+        self.last_ns = 0
+        self.max_lateness_ns = 0
+        self.total_lateness_ns = 0
+        self.max_work_ns = 0
+        self.lateness_histogram = array('q', [0]) * (len(JITTER_BUCKETS_US) + 1)
+
+    def run(self, tick: Callable[[int], None], stop_event: threading.Event):
+        perf_counter_ns = time.perf_counter_ns
+        interval_ns = self.interval_ns
+        histogram = self.lateness_histogram
+        self.start_ns = deadline = perf_counter_ns()
+        while not stop_event.is_set():
+            now = perf_counter_ns()
+            if now < deadline:
+                time.sleep((deadline - now) / 1e9)
+                now = perf_counter_ns()
+
+            # How late this tick starts relative to its deadline
+            lateness = now - deadline
+            if lateness >= interval_ns:
+                missed = lateness // interval_ns
+                self.missed_ticks += missed
+                deadline += missed * interval_ns
+                lateness -= missed * interval_ns
+            histogram[bisect_left(JITTER_BUCKETS_US, lateness // 1000)] += 1
+            self.total_lateness_ns += lateness
+            if lateness > self.max_lateness_ns:
+                self.max_lateness_ns = lateness
+
+            tick(now)
+
+            work = perf_counter_ns() - now
+            LOGGER_TICK_SECONDS.observe(work / 1e9)
+            if work > interval_ns:
+                self.overruns += 1
+                LOGGER_TICK_OVERRUNS.inc()
+            if work > self.max_work_ns:
+                self.max_work_ns = work
+            self.ticks += 1
+            self.last_ns = now
+            deadline += interval_ns
+
+    # Lateness percentile (µs), reported as the upper bound of the bucket it falls in, but
+    # never above the largest lateness seen (a bucket bound can be well past it)
+    def lateness_percentile_us(self, fraction: float) -> float:
+        total = sum(self.lateness_histogram)
+        if not total:
+            return 0.0
+        max_us = self.max_lateness_ns / 1000
+        target = fraction * total
+        seen = 0
+        for index, count in enumerate(self.lateness_histogram):
+            seen += count
+            if seen >= target:
+                if index < len(JITTER_BUCKETS_US):
+                    return min(float(JITTER_BUCKETS_US[index]), max_us)
+                return max_us
+        return max_us
+
+    def stats(self) -> Dict[str, float]:
+        elapsed_ns = self.last_ns - self.start_ns
+        ticks = self.ticks
+        return {
+            "interval_ms": self.interval_ns / 1e6,
+            "ticks": ticks,
+            "missed_ticks": self.missed_ticks,
+            "overruns": self.overruns,
+            "requested_rate_hz": 1e9 / self.interval_ns,
+            "achieved_rate_hz": (ticks - 1) * 1e9 / elapsed_ns if elapsed_ns > 0 else 0.0,
+            "lateness_mean_us": self.total_lateness_ns / ticks / 1000 if ticks else 0.0,
+            "lateness_p50_us": self.lateness_percentile_us(0.5),
+            "lateness_p99_us": self.lateness_percentile_us(0.99),
+            "lateness_max_us": self.max_lateness_ns / 1000,
+            "work_max_us": self.max_work_ns / 1000
+        }
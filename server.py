@@ -1,9 +1,11 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import uvicorn
 import threading
 import time
 import random
+from vehicle_stream import push_deltas, dict_changes
 
 app = FastAPI()
 
@@ -63,7 +65,13 @@ threading.Thread(target=update_mock_vehicle_data, daemon=True).start()
 
 @app.get("/vehicle_data")
 async def get_vehicle_data():
-    return vehicle_data
+    # Encode with orjson directly instead of going through jsonable_encoder
+    return ORJSONResponse(vehicle_data)
+
+# Push stream of changed values, a cheaper alternative to polling /vehicle_data
+@app.websocket("/ws/vehicle_data")
+async def stream_vehicle_data(websocket: WebSocket):
+    await push_deltas(websocket, dict_changes(vehicle_data))
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
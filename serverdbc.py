@@ -1,17 +1,42 @@
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException
+from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException, WebSocket, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-import uvicorn
-import cantools
-import can
+from fastapi.responses import FileResponse, StreamingResponse
+import orjson
 import threading
+import asyncio
 import time
 import os
-import csv
+from array import array
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Literal, Optional
+from signal_store import parse_name_list
+from sampler import DeadlineSampler
+from log_recorder import ChangeRecorder, ColumnarRecorder, LOG_WRITERS, iter_binary_log_as_csv, make_row_getter
+from raw_capture import RawCapture, iter_raw_log_as_csv
+from vehicle_stream import push_deltas, store_changes
+from json_responses import SnapshotResponseCache, snapshot_response
+from signal_history import HISTORY_POINTS, history_payload
+from can_filters import install_filters
+from acquisition import ChannelConfig, ReceiveStats, load_generation, open_bus, receive_loop
+from metrics import REGISTRY, SERIALISE_SECONDS
+from diagnostics import DECODE_ERRORS
+from quarantine import FrameQuarantine, parse_frame_id
 
-app = FastAPI()
+# Startup and shutdown. Nothing heavy happens at import time: the DBC files are loaded in a
+# worker thread while the server already answers requests (/health reports when decoding is
+# ready), and the CAN buses are only opened by the receive threads once they have a DBC.
+@asynccontextmanager
+async def lifespan(app):
+    global dbc_loader
+    dbc_loader = asyncio.create_task(load_initial_generation())
+    REGISTRY.start()
+    if ACQUISITION_MODE == "thread":
+        start_receive_threads()
+    yield
+    await shutdown_event()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for frontend requests
 app.add_middleware(
@@ -28,32 +53,113 @@ DBC_FILE_PATHS = [
     r"C:\Users\MaxKulick\Downloads\NX0002-STS01_A01 (2).dbc"
 ]
 
-# Initialize an empty database
-dbc = cantools.database.Database()
+# CAN buses to acquire, each with its own interface settings and DBC files. With more than
+# one channel every channel needs a name, which prefixes its signal keys
+# ("inverter.INV_Status.Speed"), so frame IDs used on several buses don't collide. E.g.:
+#   ChannelConfig("inverter", {"interface": "pcan", "channel": "PCAN_USBBUS1", "bitrate": 500000}, (INV_DBC,)),
+#   ChannelConfig("bms", {"interface": "pcan", "channel": "PCAN_USBBUS2", "bitrate": 500000}, (BMS_DBC,)),
+# Without hardware, python-can's {"interface": "virtual", "channel": "<name>"} works per channel,
+# and {"interface": "replay", "channel": "logs/trace.blf", "speed": 10.0} plays a recorded
+# trace (BLF/ASC/CSV/.kmraw) through the same pipeline (speed 1.0 = real time, 0 = as fast as possible).
+CAN_CHANNELS = [
+    ChannelConfig("", {"interface": "pcan", "channel": "PCAN_USBBUS1", "bitrate": 500000}, tuple(DBC_FILE_PATHS))
+]
+
+# Where CAN frames are received and decoded:
+#   "thread"  - one receive thread per channel in this process (default)
+#   "process" - one acquisition process per channel, publishing decoded values through a
+#               shared-memory signal table, so API load can't starve the bus readers
+ACQUISITION_MODE = os.environ.get("CAN_ACQUISITION_MODE", "thread")
+
+# Most /vehicle_data/history points kept per signal (0 disables history). Allocated up front
+# for every signal, 16 bytes a point, and capped in total by signal_history.HISTORY_BUDGET.
+HISTORY_DEPTH = int(os.environ.get("CAN_HISTORY_POINTS", HISTORY_POINTS))
+
+# DBC file uploaded per channel name (replaced by the next upload to that channel)
+uploaded_dbc_files = {}
+# One DBC upload at a time, so concurrent uploads can't build on the same old generation
+dbc_upload_lock = asyncio.Lock()
+
+# Channel configs including uploaded DBC files
+def effective_channel_configs(uploads):
+    return [config._replace(dbc_files=config.dbc_files + (uploads[config.name],))
+            if config.name in uploads else config
+            for config in CAN_CHANNELS]
 
-# Load all DBC files into the database
-for dbc_path in DBC_FILE_PATHS:
+ACQUIRE_IN_PROCESS = ACQUISITION_MODE == "process"
+
+# Everything decoding depends on, replaced as a whole when a DBC is uploaded: each channel's
+# database and decoder table (frame ID -> decoder and signal slots), the valid CAN IDs, and
+# the latest value of every signal (one store slot per "Message.Signal" key; in process mode
+# a read-only view of the acquisition processes' shared table). Read it once per use.
+# None until the startup load finishes.
+decoder_generation = None
+# Set once decoder_generation is available; the receive threads wait for it
+generation_ready = threading.Event()
+# Startup DBC load task, and its error if it failed
+dbc_loader = None
+dbc_load_error = None
+
+# Load the configured DBC files in a worker thread (uploads wait for it through the lock)
+async def load_initial_generation():
+    global decoder_generation, dbc_load_error
+    start = time.perf_counter()
     try:
-        dbc.add_dbc_file(dbc_path)
-        print(f"✅ Loaded DBC file: {dbc_path}")
+        async with dbc_upload_lock:
+            decoder_generation = await asyncio.to_thread(load_generation, CAN_CHANNELS, HISTORY_DEPTH,
+                                                         ACQUIRE_IN_PROCESS, ignored=ignored_frame_ids())
+            generation_ready.set()
+        print(f"✅ Available CAN Messages: {message_count(decoder_generation)} "
+              f"(loaded in {time.perf_counter() - start:.2f}s)")
     except Exception as e:
-        print(f"❌ Error loading DBC file {dbc_path}: {e}")
+        dbc_load_error = str(e)
+        print(f"❌ Failed to load DBC files: {e}")
+
+# CAN messages over all channels
+def message_count(generation) -> int:
+    return sum(len(ids) for ids in generation.valid_can_ids.values())
 
-# Get all valid CAN IDs from the merged database
-valid_can_ids = {msg.frame_id: msg.name for msg in dbc.messages}
-print(f"✅ Available CAN Messages: {valid_can_ids}")
+# Frame ID -> message name, per channel name when there are several channels
+def available_messages(generation):
+    if len(generation.channels) == 1:
+        return generation.valid_can_ids[generation.channels[0].config.name]
+    return generation.valid_can_ids
+
+# Current generation for a request, or 503 while the DBC files are still loading
+def ready_generation():
+    generation = decoder_generation
+    if generation is None:
+        raise HTTPException(status_code=503, detail=dbc_load_error or "DBC files are still loading")
+    return generation
 
-# Global vehicle data storage
-vehicle_data = {}
 # Flag to control the CAN receiver thread
 run_can_receiver = True
+# Frame and batch counters of each channel's receive thread (acquisition processes keep their own)
+receive_stats = [ReceiveStats() for _ in CAN_CHANNELS]
+# Open bus of each channel's receive thread, so acceptance filters can be changed live
+channel_buses = [None] * len(CAN_CHANNELS)
+# Passes of each channel's receive loop, bumped before every batch (see receive_running()),
+# and whether the loop is running at all
+receive_passes = array('q', [0]) * len(CAN_CHANNELS)
+receive_active = [False] * len(CAN_CHANNELS)
+# Frame IDs each channel's receive thread skips: ignored by hand or failing to decode. In
+# process mode each acquisition process keeps the quarantine; these only hold the IDs ignored
+# by hand, so restarted processes start with them.
+channel_quarantines = [FrameQuarantine() for _ in CAN_CHANNELS]
+
+# IDs ignored by hand, per channel, for new acquisition processes
+def ignored_frame_ids():
+    return [quarantine.ignored for quarantine in channel_quarantines]
 
 # Logging-related global variables
 is_logging = False
-log_data = []
+log_recorder = None
+raw_capture = None  # Set while a raw-frame capture is running; the receive thread feeds it
+log_sampler = None
+change_recorder = None  # Set while on-change logging is running; watches the signal store
 log_start_time = None
 logging_thread = None
-log_interval = 5 # 5 milliseconds
+log_interval = 0.005 # 5 milliseconds
 current_log_id = 0
 log_directory = "./logs"
 signals_to_log = None
@@ -61,142 +167,316 @@ signals_to_log = None
 # Thread stop event
 stop_logging_event = threading.Event()
 
+# File extensions of the supported log formats (CSV and compact binary)
+LOG_EXTENSIONS = tuple(writer.extension for writer in LOG_WRITERS.values()) + (RawCapture.extension,)
+
 # Ensure log directory exists
 os.makedirs(log_directory, exist_ok=True)
 
-# Function to receive and decode real CAN data from PEAK CAN
-def receive_can_data():
-    global vehicle_data
-    
+# Log ID of a keymetrics-<id>.<ext> file name, or None for other files
+def parse_log_id(filename):
+    if filename.startswith("keymetrics-") and filename.endswith(LOG_EXTENSIONS):
+        return int(filename.split("-")[1].split(".")[0])
+    return None
+
+# Reinstall the acceptance filters of every open bus after the DBC, the raw capture or the
+# ignored IDs changed: only the frame IDs of a channel's DBC reach Python (where the interface
+# filters natively), except while a raw capture runs (it records every frame)
+def apply_can_filters():
+    for index, bus in enumerate(channel_buses):
+        if bus is not None:
+            config = CAN_CHANNELS[index]
+            result = install_filters(bus, config.bus.get("interface"), decoder_generation.channels[index].dbc,
+                                     channel_quarantines[index].ignored, open_filter=raw_capture is not None)
+            print(f"🔎 Channel '{config.name}': {result}")
+
+# Decoder table of a channel, the store it commits to and the table's frame timing, taken
+# from one generation
+def receive_target(index):
+    generation = decoder_generation
+    channel = generation.channels[index]
+    return channel.decoder_table, generation.store, channel.timing
+
+# keep_running() of a channel's receive loop: called before every batch, so once the pass
+# count moved on, the thread has finished the batch it was in
+def receive_running(index):
+    receive_passes[index] += 1
+    return run_can_receiver
+
+# Wait until every running receive thread has finished its current batch, and with it any use
+# of a raw capture or store watch it picked up before they were detached
+async def wait_for_receive_batches(timeout: float = 1.0):
+    marks = list(receive_passes)
+    deadline = time.monotonic() + timeout
+    while any(active and passes == mark for active, passes, mark in zip(receive_active, receive_passes, marks)):
+        if time.monotonic() >= deadline:
+            print("⚠️ A receive thread didn't finish its batch in time, finishing the log anyway")
+            return
+        await asyncio.sleep(0.01)
+
+# Function to receive and decode real CAN data of one channel
+def receive_can_data(index):
+    config = CAN_CHANNELS[index]
+    # The acceptance filters and decoder table come from the DBC files
+    while not generation_ready.wait(0.5):
+        if not run_can_receiver:
+            return
+    receive_active[index] = True
     try:
-        # Initialize the CAN bus with PEAK CAN interface
-        bus = can.interface.Bus(bustype='pcan', channel='PCAN_USBBUS1', bitrate=500000)
-        print("✅ Connected to PEAK CAN interface")
+        # Initialize the CAN bus of this channel, filtering to the DBC's frame IDs in the driver/kernel
+        bus = open_bus(config.bus, decoder_generation.channels[index].dbc, channel_quarantines[index].ignored,
+                       open_filter=raw_capture is not None)
+        channel_buses[index] = bus
+        print(f"✅ Connected to {config.bus.get('interface')} {config.bus.get('channel')} (channel '{config.name}')")
         
-        # Continuous reception loop
-        while run_can_receiver:
-            try:
-                # Receive a CAN message with 0.1s timeout
-                message = bus.recv(0.1)
-                
-                if message:
-                    # Check if the received message ID is in our DBC database
-                    if message.arbitration_id in valid_can_ids:
-                        # Get the message name from our mapping
-                        message_name = valid_can_ids[message.arbitration_id]
-                        
-                        try:
-                            # Decode the message
-                            dbc_message = dbc.get_message_by_frame_id(message.arbitration_id)
-                            decoded_data = dbc.decode_message(message.arbitration_id, message.data)
-                            
-                            # Format data with message name prefix for each signal
-                            formatted_data = {f"{message_name}.{sig_name}": value 
-                                            for sig_name, value in decoded_data.items()}
-                            
-                            # Update vehicle data dictionary
-                            vehicle_data.update(formatted_data)
-                            
-                            # Log periodically (every 50 messages to avoid console spam)
-                            if message.arbitration_id % 50 == 0:
-                                print(f"📡 Received CAN ID: 0x{message.arbitration_id:X}, Message: {message_name}")
-                        
-                        except Exception as decode_error:
-                            print(f"⚠️ Error decoding message {message_name} (ID: 0x{message.arbitration_id:X}): {decode_error}")
-            
-            except can.CanError as e:
-                print(f"⚠️ CAN Bus error: {e}")
-                time.sleep(1)  # Wait a bit before retrying
+        # Drain pending frames in batches and commit each decoded batch to the store at once.
+        # The decoder table, store and raw capture are picked up per batch, so DBC uploads and
+        # logging sessions apply without restarting the loop.
+        receive_loop(bus, lambda: receive_target(index), receive_stats[index],
+                     lambda: receive_running(index), lambda: raw_capture, channel_quarantines[index], config.name)
                 
     except Exception as setup_error:
         print(f"❌ Failed to setup CAN interface: {setup_error}")
         print("⚠️ Falling back to mock data generation")
         # Fall back to mock data if CAN interface fails
-        generate_mock_can_data()
+        generate_mock_can_data(index)
     
     finally:
         # Cleanup when thread exits
+        receive_active[index] = False
+        channel_buses[index] = None
         if 'bus' in locals():
             bus.shutdown()
             print("💤 CAN bus shutdown")
 
 # Backup function for mock data (in case CAN hardware fails)
-def generate_mock_can_data():
+def generate_mock_can_data(index):
     import random
     
     print("🔄 Using mock data generation")
     
-    while run_can_receiver:
+    while receive_running(index):
         # Update all signals every 0.5 seconds
         time.sleep(0.5)
         
-        # Generate new values for all messages and signals
-        for can_id, message_name in valid_can_ids.items():
-            message = dbc.get_message_by_frame_id(can_id)
-            
-            # Generate random values for each signal
-            data_values = {f"{message_name}.{sig.name}": random.uniform(0, 100) for sig in message.signals}
-            
-            # Store the decoded data
-            vehicle_data.update(data_values)
+        # Generate new values for all messages and signals of this channel
+        decoder_table, store, _ = receive_target(index)
+        for entry in decoder_table.values():
+            # Generate random values for each signal and store them
+            store.commit(entry.slots, [random.uniform(0, 100) for _ in entry.slots], time.monotonic())
         
         # Print just a confirmation that all signals were updated
         print(f"📡 Updated all mock CAN signals at {time.strftime('%H:%M:%S')}")
 
 # Dedicated background thread function for logging at precise intervals
 def logging_thread_function():
-    global log_data, vehicle_data, signals_to_log, log_start_time
-    
     print(f"🕒 Starting high-frequency logging thread (interval: {log_interval*1000}ms)")
-    log_count = 0
-    last_report_time = time.time()
+    recorder = log_recorder
+    sampler = log_sampler
+    store = None
+    get_row = None
     
-    while not stop_logging_event.is_set():
-        # Get current timestamp
-        timestamp = datetime.now()
-        elapsed_ms = int((timestamp - log_start_time).total_seconds() * 1000) if log_start_time else 0
-        
-        # Create a log entry with timestamp
-        log_entry = {
-            "timestamp": timestamp.isoformat(),
-            "elapsed_ms": elapsed_ms
-        }
+    def sample(now_ns):
+        nonlocal store, get_row
+        # Resolve the logged signals against the store (again only if a new DBC was loaded)
+        if store is not decoder_generation.store:
+            store = decoder_generation.store
+            get_row = make_row_getter(store, recorder.keys)
         
-        # Check if we're logging specific signals or all data
-        if signals_to_log:
-            # Only log the specified signals
-            filtered_data = {key: vehicle_data[key] for key in signals_to_log if key in vehicle_data}
-            log_entry.update(filtered_data)
-        else:
-            # Log all vehicle data
-            log_entry.update(vehicle_data)
-            
-        log_data.append(log_entry)
-        log_count += 1
+        # Record a consistent copy of the logged signals into the current chunk
+        snapshot = store.snapshot()
+        recorder.record(now_ns, get_row(snapshot.values))
         
         # Report logging status every 1000 entries
-        if log_count % 1000 == 0:
-            current_time = time.time()
-            duration = current_time - last_report_time
-            rate = 1000 / duration if duration > 0 else 0
-            print(f"📊 Logged {log_count} entries (current rate: {rate:.1f} entries/sec)")
-            last_report_time = current_time
-        
-        # Sleep precisely for the logging interval
-        time.sleep(log_interval)
+        if recorder.rows_recorded % 1000 == 0:
+            stats = sampler.stats()
+            print(f"📊 Logged {recorder.rows_recorded} entries (rate: {stats['achieved_rate_hz']:.1f}/{stats['requested_rate_hz']:.1f} entries/sec, "
+                  f"missed: {stats['missed_ticks']}, p99 jitter: {stats['lateness_p99_us']:.0f}µs)")
+    
+    # Sample on absolute deadlines so the period doesn't drift with work or sleep overshoot
+    sampler.run(sample, stop_logging_event)
+
+# Start one CAN receiver thread per channel (unless acquisition processes receive)
+def start_receive_threads():
+    global can_threads
+    can_threads = [threading.Thread(target=receive_can_data, args=(index,), daemon=True)
+                   for index in range(len(CAN_CHANNELS))]
+    for can_thread in can_threads:
+        can_thread.start()
+
+# Liveness and readiness: "loading" until the startup DBC load finished, "error" if it failed
+@app.get("/health")
+async def get_health():
+    generation = decoder_generation
+    if generation is not None:
+        return {"status": "ready", "messages": message_count(generation), "signals": len(generation.store)}
+    return Response(orjson.dumps({"status": "error" if dbc_load_error else "loading", "error": dbc_load_error}),
+                    status_code=503, media_type="application/json")
 
-# Start the CAN receiver in a separate thread
-can_thread = threading.Thread(target=receive_can_data, daemon=True)
-can_thread.start()
+# Encoded /vehicle_data bodies, shared by all pollers until the store generation advances
+vehicle_data_cache = SnapshotResponseCache()
 
+# Optional filters, e.g. ?messages=BMS_TX_STATE_7,INV_*&signals=Cell_Temp_*
+# Signals with value descriptions (VAL_) give their label, e.g. "CHARGING", when the raw value
+# has one (as cantools decodes them), and their number otherwise; /vehicle_data/history is
+# always numeric
 @app.get("/vehicle_data")
-async def get_vehicle_data():
-    global vehicle_data
-    return vehicle_data
+async def get_vehicle_data(request: Request, messages: Optional[str] = None, signals: Optional[str] = None):
+    store = ready_generation().store
+    if not messages and not signals:
+        return snapshot_response(request, vehicle_data_cache, store)
+    
+    # Resolve the filters through the store's index (cached per distinct selection)
+    selection = (parse_name_list(messages), parse_name_list(signals))
+    slots = store.index.select(*selection)
+    return snapshot_response(request, vehicle_data_cache, store,
+                             build=lambda snapshot: store.as_dict(snapshot, slots), selection=selection)
+
+# Recent history for charting, e.g. ?signals=Cell_Temp_*&since=-60&max_points=300
+# downsample: "lttb" (default), "minmax" or "none"
+@app.get("/vehicle_data/history")
+async def get_vehicle_data_history(messages: Optional[str] = None, signals: Optional[str] = None,
+                                   since: Optional[float] = None, max_points: int = 500,
+                                   downsample: str = "lttb"):
+    if not messages and not signals:
+        raise HTTPException(status_code=400, detail="Select signals with ?signals= and/or ?messages=")
+    store = ready_generation().store
+    slots = store.index.select(parse_name_list(messages), parse_name_list(signals))
+    # Reading the rings and downsampling is pure Python work: keep it off the event loop
+    payload = await asyncio.to_thread(history_payload, store, slots, since, max(3, max_points), downsample)
+    with SERIALISE_SECONDS.labels("history").time():
+        body = orjson.dumps({"signals": payload})
+    return Response(body, media_type="application/json")
+
+# Push stream of changed signals, a cheaper alternative to polling /vehicle_data
+@app.websocket("/ws/vehicle_data")
+async def stream_vehicle_data(websocket: WebSocket):
+    if decoder_generation is None:
+        await websocket.close(code=1013)  # Try again later
+        return
+    await push_deltas(websocket, store_changes(lambda: decoder_generation.store))
+
+# Configured channels with their receive counters, and the acquisition processes (process mode)
+@app.get("/acquisition")
+async def get_acquisition_status():
+    generation = ready_generation()
+    acquisition = generation.acquisition
+    stats = acquisition.stats if acquisition else receive_stats
+    return {
+        "mode": ACQUISITION_MODE,
+        "channels": [{
+            "name": config.name,
+            "bus": config.bus,
+            "dbc_files": list(config.dbc_files),
+            "receive": channel_stats.stats()
+        } for config, channel_stats in zip((channel.config for channel in generation.channels), stats)],
+        "processes": acquisition.status() if acquisition else None,
+        # Windowed rates and latency percentiles of this process's hot path (in process mode
+        # the receive loops run in the acquisition processes and aren't included)
+        "metrics": REGISTRY.summary()
+    }
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def get_metrics():
+    return Response(REGISTRY.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+# Decode failures per frame ID (count, latest error and payload) and the most recent failures,
+# formatted on request. In process mode the failures happen in the acquisition processes:
+# only their counts (per channel, under /acquisition) reach this process.
+@app.get("/can_errors")
+async def get_error_details(limit: int = 50):
+    return {
+        "mode": ACQUISITION_MODE,
+        "errors": DECODE_ERRORS.summary(),
+        "recent": DECODE_ERRORS.samples(limit)
+    }
+
+# Index of a channel by name (default: the first channel)
+def channel_index(channel: Optional[str]) -> int:
+    if channel is None:
+        return 0
+    for index, config in enumerate(CAN_CHANNELS):
+        if config.name == channel:
+            return index
+    raise HTTPException(status_code=404, detail=f"Unknown CAN channel '{channel}'")
 
+# Run a quarantine command in the acquisition process of a channel (process mode)
+async def acquisition_control(index: int, command: str, frame_id: Optional[int] = None):
+    acquisition = ready_generation().acquisition
+    try:
+        return await asyncio.to_thread(acquisition.control, index, command, frame_id)
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+# Frame IDs each channel skips: ignored by hand, quarantined after persistent decode failures
+# (with the time to their next probe) and being probed after a quarantine
+@app.get("/quarantine")
+async def get_quarantine():
+    if ACQUIRE_IN_PROCESS:
+        return {config.name: await acquisition_control(index, "status") for index, config in enumerate(CAN_CHANNELS)}
+    now = time.monotonic()
+    return {config.name: quarantine.status(now) for config, quarantine in zip(CAN_CHANNELS, channel_quarantines)}
+
+# Ignore a frame ID ("0x467" or decimal) on a channel until it's released
+@app.post("/quarantine/{message_id}")
+async def ignore_frame(message_id: str, channel: Optional[str] = None):
+    index = channel_index(channel)
+    try:
+        frame_id = parse_frame_id(message_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid message ID format")
+    if ACQUIRE_IN_PROCESS:
+        # The acquisition process applies it (and reinstalls its filters); the local copy,
+        # handed to the processes of the next DBC load, only follows once it answered
+        changed = await acquisition_control(index, "ignore", frame_id)
+        if changed:
+            channel_quarantines[index].ignore(frame_id)
+    else:
+        changed = channel_quarantines[index].ignore(frame_id)
+    if not changed:
+        return {"message": f"Already ignoring message ID: 0x{frame_id:X}"}
+    if decoder_generation is not None:
+        apply_can_filters()
+    return {"message": f"Now ignoring message ID: 0x{frame_id:X}"}
+
+# Decode a frame ID again, whether it was ignored by hand or quarantined
+@app.delete("/quarantine/{message_id}")
+async def release_frame(message_id: str, channel: Optional[str] = None):
+    index = channel_index(channel)
+    try:
+        frame_id = parse_frame_id(message_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid message ID format")
+    if ACQUIRE_IN_PROCESS:
+        # The acquisition process applies it (and reinstalls its filters); the local copy,
+        # handed to the processes of the next DBC load, only follows once it answered
+        changed = await acquisition_control(index, "release", frame_id)
+        if changed:
+            channel_quarantines[index].release(frame_id)
+    else:
+        changed = channel_quarantines[index].release(frame_id)
+    if not changed:
+        return {"message": f"Message ID 0x{frame_id:X} wasn't ignored or quarantined"}
+    if decoder_generation is not None:
+        apply_can_filters()
+    return {"message": f"Released message ID: 0x{frame_id:X}"}
+
+# Per-frame-ID rate, period, jitter, age and DLC mismatches of every channel, to spot an ECU
+# whose cyclic message slows down, bursts or stops
+@app.get("/bus_health")
+async def get_bus_health():
+    now = time.time()
+    return {channel.config.name: channel.timing.stats(now) for channel in ready_generation().channels}
+
+# The uploaded DBC is added to one channel's DBC files (?channel=name, default: the first channel)
 @app.post("/upload_dbc/")
-async def upload_dbc(file: UploadFile = File(...)):
-    global dbc, valid_can_ids
+async def upload_dbc(file: UploadFile = File(...), channel: Optional[str] = None):
+    global decoder_generation, dbc_load_error
+    if channel is None:
+        channel = CAN_CHANNELS[0].name
+    if channel not in {config.name for config in CAN_CHANNELS}:
+        raise HTTPException(status_code=404, detail=f"Unknown CAN channel '{channel}'")
     new_dbc_path = f"./uploaded_{file.filename}"
 
     # Save the new DBC file
@@ -205,21 +485,24 @@ async def upload_dbc(file: UploadFile = File(...)):
 
     # Reload the DBC
     try:
-        # Create a new database
-        new_dbc = cantools.database.Database()
-        
-        # Add all existing files
-        for dbc_path in DBC_FILE_PATHS:
-            new_dbc.add_dbc_file(dbc_path)
-        
-        # Add the newly uploaded file
-        new_dbc.add_dbc_file(new_dbc_path)
-        
-        # Replace the old database
-        dbc = new_dbc
-        valid_can_ids = {msg.frame_id: msg.name for msg in dbc.messages}
+        # Load every channel again, with the newly uploaded file added to its channel. Parsing
+        # (and restarting acquisition processes) runs in a worker thread so the event loop
+        # keeps serving requests; the old generation stays in use until the swap below.
+        async with dbc_upload_lock:
+            configs = effective_channel_configs({**uploaded_dbc_files, channel: new_dbc_path})
+            generation = await asyncio.to_thread(load_generation, configs, HISTORY_DEPTH, ACQUIRE_IN_PROCESS,
+                                                 decoder_generation, True, ignored_frame_ids())
+            if change_recorder is not None:
+                change_recorder.bind(generation.store)
+            
+            # Replace the old databases, tables and store in one step
+            decoder_generation = generation
+            uploaded_dbc_files[channel] = new_dbc_path
+            dbc_load_error = None
+            generation_ready.set()
+        apply_can_filters()
         print(f"✅ New DBC Loaded: {file.filename}")
-        return {"message": f"Successfully loaded {file.filename}", "available_messages": valid_can_ids}
+        return {"message": f"Successfully loaded {file.filename}", "available_messages": available_messages(generation)}
     except Exception as e:
         return {"error": f"Failed to load DBC file: {str(e)}"}
 
@@ -227,32 +510,46 @@ async def upload_dbc(file: UploadFile = File(...)):
 
 @app.get("/logging/status")
 async def get_logging_status():
-    global is_logging, log_data, current_log_id, log_interval
+    global is_logging, log_recorder, current_log_id, log_interval
     return {
         "is_logging": is_logging,
-        "entries_count": len(log_data),
+        "entries_count": log_recorder.rows_recorded if log_recorder else 0,
+        "chunks_flushed": log_recorder.chunks_flushed if log_recorder else 0,
+        "write_queue_depth": log_recorder.queue_depth if log_recorder else 0,
+        "write_error": log_recorder.error if log_recorder else None,
+        "frames_dropped": raw_capture.dropped if raw_capture else 0,
+        "rows_dropped": getattr(log_recorder, "rows_dropped", 0),
+        "buffer_bytes": log_recorder.buffer_bytes if log_recorder else 0,
         "current_log_id": current_log_id,
-        "log_interval_ms": log_interval * 1000  # Convert to milliseconds
+        "log_interval_ms": log_interval * 1000,  # Convert to milliseconds
+        "sampler": log_sampler.stats() if log_sampler else None
     }
 
 # Define a Pydantic model for the request
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
 
 class LoggingRequest(BaseModel):
     signals_to_log: Optional[List[str]] = None
     log_interval_ms: Optional[float] = None  # Allow setting interval
+    format: Literal["csv", "binary", "raw"] = "csv"  # "binary" records a compact columnar .kmlog file
+                                                    # "raw" captures every frame undecoded (.kmraw)
+    mode: Literal["interval", "on_change"] = "interval"  # "on_change" writes a row when a logged signal changes
+    deadbands: Optional[Dict[str, float]] = None  # Per-signal change threshold for "on_change"
 
 @app.post("/logging/start")
 async def start_logging(request: LoggingRequest):
-    global is_logging, log_data, log_start_time, current_log_id, logging_thread, signals_to_log, log_interval, stop_logging_event
+    global is_logging, log_recorder, raw_capture, log_sampler, change_recorder, log_start_time, current_log_id, logging_thread, signals_to_log, log_interval, stop_logging_event
     
     if is_logging:
         return {"status": "already_logging", "message": "Logging is already in progress"}
     
-    # Clear previous log data and start fresh
-    log_data = []
-    log_start_time = datetime.now()
+    generation = ready_generation()
+    # Raw capture and on-change logging hook into the receive loop, which runs elsewhere in process mode
+    if generation.acquisition is not None and (request.format == "raw" or request.mode == "on_change"):
+        return {"status": "unsupported", "message": "Raw and on-change logging need CAN_ACQUISITION_MODE=thread"}
+    # Raw captures hold the frames of one bus
+    if request.format == "raw" and len(CAN_CHANNELS) > 1:
+        return {"status": "unsupported", "message": "Raw capture needs a single CAN channel"}
     
     # Store the list of signals to log if provided
     signals_to_log = request.signals_to_log
@@ -261,19 +558,53 @@ async def start_logging(request: LoggingRequest):
     if request.log_interval_ms is not None:
         log_interval = max(0.001, request.log_interval_ms / 1000)  # Ensure minimum 1ms interval
     
-    # Reset the stop event
-    stop_logging_event.clear()
-    
-    # Start the dedicated logging thread
-    logging_thread = threading.Thread(target=logging_thread_function, daemon=True)
-    logging_thread.start()
-    is_logging = True
-    
     # Find the next log ID
     current_log_id = 1
-    while os.path.exists(os.path.join(log_directory, f"keymetrics-{current_log_id}.csv")):
+    while any(os.path.exists(os.path.join(log_directory, f"keymetrics-{current_log_id}{ext}"))
+              for ext in LOG_EXTENSIONS):
         current_log_id += 1
     
+    log_start_time = datetime.now()
+    if request.format == "raw":
+        # Raw capture: the receive thread records every frame, decoding happens at download time
+        filepath = os.path.join(log_directory, f"keymetrics-{current_log_id}{RawCapture.extension}")
+        raw_capture = RawCapture(filepath, log_start_time.timestamp(), generation.channels[0].config.dbc_files)
+        log_recorder = raw_capture
+        # Let frames the DBC doesn't know through for the capture
+        apply_can_filters()
+        log_sampler = None
+        logging_thread = None
+        is_logging = True
+    else:
+        # Open the log file with its columns fixed up front; chunks are flushed to it while logging runs
+        store = generation.store
+        logged_keys = signals_to_log if signals_to_log else store.keys
+        writer_class = LOG_WRITERS[request.format]
+        filepath = os.path.join(log_directory, f"keymetrics-{current_log_id}{writer_class.extension}")
+        writer = writer_class(filepath, logged_keys, time.perf_counter_ns(), log_start_time.timestamp(),
+                              store.column_choices(logged_keys))
+        
+        if request.mode == "on_change":
+            # The receive thread records rows as logged signals change; it must never block on the writer
+            log_recorder = ColumnarRecorder(logged_keys, writer, blocking=False)
+            log_sampler = None
+            logging_thread = None
+            change_recorder = ChangeRecorder(log_recorder, request.deadbands)
+            change_recorder.seed(store)
+            change_recorder.bind(store)
+            is_logging = True
+        else:
+            log_recorder = ColumnarRecorder(logged_keys, writer)
+            log_sampler = DeadlineSampler(log_interval)
+            
+            # Reset the stop event
+            stop_logging_event.clear()
+            
+            # Start the dedicated logging thread
+            logging_thread = threading.Thread(target=logging_thread_function, daemon=True)
+            logging_thread.start()
+            is_logging = True
+    
     print(f"✅ Started logging with ID {current_log_id} (interval: {log_interval*1000}ms)")
     if signals_to_log:
         print(f"  📊 Logging {len(signals_to_log)} specific signals")
@@ -288,13 +619,15 @@ async def start_logging(request: LoggingRequest):
         "status": "started", 
         "message": f"Logging started with ID {current_log_id}",
         "log_id": current_log_id,
+        "format": request.format,
+        "mode": request.mode if request.format != "raw" else "raw",
         "signals_count": len(signals_to_log) if signals_to_log else "all",
         "log_interval_ms": log_interval * 1000
     }
 
 @app.post("/logging/stop")
 async def stop_logging(background_tasks: BackgroundTasks):
-    global is_logging, log_data, current_log_id, stop_logging_event, logging_thread
+    global is_logging, log_recorder, raw_capture, change_recorder, current_log_id, stop_logging_event, logging_thread
     
     if not is_logging:
         return {"status": "not_logging", "message": "Logging is not in progress"}
@@ -305,66 +638,106 @@ async def stop_logging(background_tasks: BackgroundTasks):
     # Wait for the thread to finish
     if logging_thread and logging_thread.is_alive():
         print("⏳ Waiting for logging thread to complete...")
-        logging_thread.join(timeout=5.0)  # Wait up to 5 seconds
+        await asyncio.to_thread(logging_thread.join, 5.0)  # Wait up to 5 seconds
     
-    if len(log_data) == 0:
-        is_logging = False
-        return {"status": "empty", "message": "No data logged"}
+    # Detach the raw capture / change watcher from the receive thread before finishing
+    if raw_capture is not None:
+        raw_capture = None
+        apply_can_filters()
+    if change_recorder is not None:
+        change_recorder.unbind(decoder_generation.store)
+        change_recorder = None
+    # A batch already in progress may still write to them: let the receive threads finish it
+    await wait_for_receive_batches()
+    
+    # Everything but the last chunk is already on disk; wait for it to be flushed and fsynced
+    await asyncio.to_thread(log_recorder.finish)
+    is_logging = False
     
     # Generate the filename
-    filename = f"keymetrics-{current_log_id}.csv"
-    filepath = os.path.join(log_directory, filename)
+    filepath = log_recorder.filepath
+    filename = os.path.basename(filepath)
     
-    # Schedule background task to save the file
-    background_tasks.add_task(save_log_to_csv, log_data, filepath)
+    if log_recorder.rows_recorded == 0:
+        os.remove(filepath)
+        return {"status": "empty", "message": "No data logged"}
     
     # Schedule cleanup of old log files (keep only the 5 most recent)
     background_tasks.add_task(cleanup_old_logs, 5)
     
-    # Update status
-    is_logging = False
-    
-    print(f"✅ Stopped logging. Saving to {filename} ({len(log_data)} entries)")
+    print(f"✅ Stopped logging. Saved {filename} ({log_recorder.rows_recorded} entries)")
     print(f"🧹 Cleaning up old log files (keeping most recent 5)")
     return {
         "status": "stopped", 
-        "message": f"Logging stopped. Saving to {filename}",
+        "message": f"Logging stopped. Saved to {filename}",
         "log_id": current_log_id,
-        "entry_count": len(log_data),
+        "entry_count": log_recorder.rows_recorded,
         "filename": filename
     }
 
+# Raw captures are decoded with the DBC files loaded now; one recorded with other DBC contents
+# is refused (409) rather than decoded with the wrong table
+def raw_log_as_csv(filepath):
+    channel = ready_generation().channels[0]
+    return iter_raw_log_as_csv(filepath, channel.decoder_table, channel.config.dbc_files)
+
 @app.get("/logging/download/{log_id}")
-async def download_log(log_id: int):
+async def download_log(log_id: int, format: str = "csv"):
     filepath = os.path.join(log_directory, f"keymetrics-{log_id}.csv")
-    if not os.path.exists(filepath):
-        raise HTTPException(status_code=404, detail=f"Log file keymetrics-{log_id}.csv not found")
+    if os.path.exists(filepath):
+        return FileResponse(
+            filepath, 
+            media_type="text/csv", 
+            filename=f"keymetrics-{log_id}.csv"
+        )
     
-    return FileResponse(
-        filepath, 
-        media_type="text/csv", 
-        filename=f"keymetrics-{log_id}.csv"
-    )
+    for extension, to_csv in ((".kmlog", iter_binary_log_as_csv),
+                              (RawCapture.extension, raw_log_as_csv)):
+        filepath = os.path.join(log_directory, f"keymetrics-{log_id}{extension}")
+        if not os.path.exists(filepath):
+            continue
+        
+        # Binary logs are served as-is on request, otherwise converted to CSV chunk by chunk
+        if format == "binary":
+            return FileResponse(
+                filepath,
+                media_type="application/octet-stream",
+                filename=f"keymetrics-{log_id}{extension}"
+            )
+        try:
+            rows = to_csv(filepath)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return StreamingResponse(
+            rows,
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="keymetrics-{log_id}.csv"'}
+        )
+    
+    raise HTTPException(status_code=404, detail=f"Log file keymetrics-{log_id} not found")
 
 @app.get("/logging/list")
 async def list_logs():
     log_files = []
     for filename in os.listdir(log_directory):
-        if filename.startswith("keymetrics-") and filename.endswith(".csv"):
+        log_id = parse_log_id(filename)
+        if log_id is not None:
             filepath = os.path.join(log_directory, filename)
             log_files.append({
                 "filename": filename,
+                "format": {".kmlog": "binary", RawCapture.extension: "raw"}.get(os.path.splitext(filename)[1], "csv"),
                 "size_bytes": os.path.getsize(filepath),
                 "created": datetime.fromtimestamp(os.path.getctime(filepath)).isoformat(),
-                "id": int(filename.split("-")[1].split(".")[0])
+                "id": log_id
             })
     
     return sorted(log_files, key=lambda x: x["id"])
 
 @app.get("/logging/debug")
 async def debug_logging():
-    global signals_to_log, is_logging, log_interval, log_data
+    global signals_to_log, is_logging, log_interval, log_recorder
     
+    vehicle_data = ready_generation().store.as_dict()
     sample_vehicle_data = {}
     if vehicle_data:
         sample_keys = list(vehicle_data.keys())[:5]
@@ -378,52 +751,26 @@ async def debug_logging():
         "logging_thread_status": thread_status,
         "signals_to_log": signals_to_log,
         "signals_to_log_count": len(signals_to_log) if signals_to_log else 0,
-        "log_entries_count": len(log_data),
+        "log_entries_count": log_recorder.rows_recorded if log_recorder else 0,
         "sample_vehicle_data_keys": list(vehicle_data.keys())[:10] if vehicle_data else [],
         "vehicle_data_count": len(vehicle_data) if vehicle_data else 0,
         "sample_vehicle_data": sample_vehicle_data
     }
 
-# Helper function to save log data to CSV
-def save_log_to_csv(data: List[Dict[str, Any]], filepath: str):
-    if not data:
-        return False
-    
-    try:
-        # Get all possible field names from the data
-        fieldnames = set()
-        for entry in data:
-            fieldnames.update(entry.keys())
-        
-        # Sort fieldnames for consistent column order - timestamp and elapsed_ms first
-        sorted_fieldnames = ["timestamp", "elapsed_ms"]
-        sorted_fieldnames.extend(sorted([f for f in fieldnames if f not in sorted_fieldnames]))
-        
-        # Write to CSV file
-        with open(filepath, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=sorted_fieldnames)
-            writer.writeheader()
-            writer.writerows(data)
-        
-        print(f"✅ Log file saved successfully: {filepath}")
-        return True
-    except Exception as e:
-        print(f"❌ Error saving log file: {e}")
-        return False
-
 # Helper function to clean up old log files
 def cleanup_old_logs(max_files_to_keep=5):
     try:
         # Get all log files
         log_files = []
         for filename in os.listdir(log_directory):
-            if filename.startswith("keymetrics-") and filename.endswith(".csv"):
+            log_id = parse_log_id(filename)
+            if log_id is not None:
                 filepath = os.path.join(log_directory, filename)
                 log_files.append({
                     "filename": filename,
                     "filepath": filepath,
                     "created": os.path.getctime(filepath),
-                    "id": int(filename.split("-")[1].split(".")[0])
+                    "id": log_id
                 })
         
         # Sort by creation time (newest first)
@@ -445,10 +792,9 @@ def cleanup_old_logs(max_files_to_keep=5):
         print(f"⚠️ Error during log cleanup: {e}")
         return 0
 
-# Gracefully handle shutdown
-@app.on_event("shutdown")
-def shutdown_event():
-    global run_can_receiver, is_logging, stop_logging_event, logging_thread
+# Gracefully handle shutdown (called by lifespan)
+async def shutdown_event():
+    global run_can_receiver, is_logging, raw_capture, change_recorder, stop_logging_event, logging_thread
     print("🛑 Shutting down CAN receiver")
     
     # Stop logging if active
@@ -458,18 +804,27 @@ def shutdown_event():
         
         # Wait briefly for the logging thread to exit
         if logging_thread and logging_thread.is_alive():
-            logging_thread.join(timeout=2.0)
+            await asyncio.to_thread(logging_thread.join, 2.0)
             
         is_logging = False
+        raw_capture = None
+        if change_recorder is not None:
+            change_recorder.unbind(decoder_generation.store)
+            change_recorder = None
+        await wait_for_receive_batches()
         
-        if log_data and len(log_data) > 0:
-            filename = f"keymetrics-{current_log_id}.csv"
-            filepath = os.path.join(log_directory, filename)
-            save_log_to_csv(log_data, filepath)
+        # Flush the last chunk so the file on disk is complete
+        await asyncio.to_thread(log_recorder.finish)
     
     run_can_receiver = False
+    # A still running startup load would start acquisition processes after this point
+    if dbc_loader is not None:
+        await dbc_loader
+    if decoder_generation is not None and decoder_generation.acquisition is not None:
+        await asyncio.to_thread(decoder_generation.acquisition.stop)
     # Give the thread time to clean up
-    time.sleep(0.5)
+    await asyncio.sleep(0.5)
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
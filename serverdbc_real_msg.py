@@ -1,11 +1,20 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, WebSocket, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-import cantools
-import can
+import orjson
 import threading
+import asyncio
 import time
-import os
+from typing import Optional
+from can_filters import install_filters
+from signal_store import parse_name_list
+from vehicle_stream import push_deltas, store_changes
+from json_responses import SnapshotResponseCache, snapshot_response
+from signal_history import HISTORY_POINTS, history_payload
+from acquisition import ChannelConfig, ReceiveStats, load_generation, open_bus, receive_loop
+from diagnostics import DECODE_ERRORS, format_error_key
+from quarantine import FrameQuarantine, parse_frame_id
+from metrics import REGISTRY, SERIALISE_SECONDS
 
 app = FastAPI()
 
@@ -25,121 +34,117 @@ DBC_FILE_PATHS = [
     
 ]
 
-# Initialize an empty database
-dbc = cantools.database.Database()
+# The PEAK CAN bus and its DBC files
+CAN_CHANNEL = ChannelConfig("", {"interface": "pcan", "channel": "PCAN_USBBUS1", "bitrate": 500000},
+                            tuple(DBC_FILE_PATHS))
 
-# Load all DBC files into the database
-for dbc_path in DBC_FILE_PATHS:
-    try:
-        dbc.add_dbc_file(dbc_path)
-        print(f"✅ Loaded DBC file: {dbc_path}")
-    except Exception as e:
-        print(f"❌ Error loading DBC file {dbc_path}: {e}")
-
-# Get all valid CAN IDs from the merged database
-valid_can_ids = {msg.frame_id: msg.name for msg in dbc.messages}
-print(f"✅ Available CAN Messages: {valid_can_ids}")
+# Everything decoding depends on, replaced as a whole when a DBC is uploaded: the merged
+# database and decoder table (frame ID -> decoder and signal slots), the valid CAN IDs and
+# the latest value of every signal (one store slot per "Message.Signal" key)
+decoder_generation = load_generation([CAN_CHANNEL], HISTORY_POINTS)
+print(f"✅ Available CAN Messages: {decoder_generation.valid_can_ids[CAN_CHANNEL.name]}")
 
-# List of message IDs to ignore (add problematic ones here)
-IGNORED_MESSAGE_IDS = [0x467]  # BMS_TX_STATE_8 (ID: 0x467)
+# Message IDs ignored from the start (more can be ignored through the API); IDs that keep
+# failing to decode are quarantined automatically
+IGNORED_MESSAGE_IDS = (0x467,)  # BMS_TX_STATE_8 (ID: 0x467)
+quarantine = FrameQuarantine(IGNORED_MESSAGE_IDS)
 
 print(f"⚠️ Ignoring messages: {', '.join([f'0x{id:X}' for id in IGNORED_MESSAGE_IDS])}")
 
-# Global vehicle data storage
-vehicle_data = {}
 # Flag to control the CAN receiver thread
 run_can_receiver = True
+# The open bus, so acceptance filters can be changed while it runs
+can_bus = None
+# Receive counters (frames, batches, decoded, ignored, batch sizes), written by the receive
+# thread only; decode failures are kept by diagnostics.DECODE_ERRORS
+receive_stats = ReceiveStats()
 # Statistics for monitoring
 statistics = {
-    "messages_received": 0,
-    "messages_decoded": 0,
-    "messages_ignored": 0,
-    "errors": {},
     "start_time": time.time()
 }
+REGISTRY.start()
 
 # Function to receive and decode real CAN data
 def receive_can_data():
-    global vehicle_data, statistics
+    global can_bus
     
     try:
-        # Initialize the CAN bus with PEAK CAN interface
-        bus = can.interface.Bus(interface='pcan', channel='PCAN_USBBUS1', bitrate=500000)
+        # Initialize the CAN bus with PEAK CAN interface; only frame IDs of the DBC that aren't
+        # ignored are delivered (filtered in the driver/hardware where the interface supports it)
+        bus = open_bus(CAN_CHANNEL.bus, decoder_generation.channels[0].dbc, quarantine.ignored)
+        can_bus = bus
         print("✅ Connected to PEAK CAN interface")
         
-        # Continuous reception loop
-        while run_can_receiver:
-            try:
-                # Receive a CAN message with 0.1s timeout
-                message = bus.recv(0.1)
-                
-                if message:
-                    statistics["messages_received"] += 1
-                    
-                    # Skip messages in the ignore list
-                    if message.arbitration_id in IGNORED_MESSAGE_IDS:
-                        statistics["messages_ignored"] += 1
-                        continue
-                    
-                    # Check if the received message ID is in our DBC database
-                    if message.arbitration_id in valid_can_ids:
-                        # Get the message name from our mapping
-                        message_name = valid_can_ids[message.arbitration_id]
-                        
-                        try:
-                            # Decode the message
-                            decoded_data = dbc.decode_message(message.arbitration_id, message.data)
-                            
-                            # Format data with message name prefix for each signal
-                            formatted_data = {f"{message_name}.{sig_name}": value 
-                                            for sig_name, value in decoded_data.items()}
-                            
-                            # Update vehicle data dictionary
-                            vehicle_data.update(formatted_data)
-                            statistics["messages_decoded"] += 1
-                            
-                            # Log periodically (only every 100th message to reduce console output)
-                            if statistics["messages_decoded"] % 100 == 0:
-                                print(f"📡 Processed {statistics['messages_decoded']} messages, ignored {statistics['messages_ignored']}")
-                        
-                        except Exception as decode_error:
-                            # Track error by message ID
-                            error_key = f"0x{message.arbitration_id:X}"
-                            if error_key not in statistics["errors"]:
-                                statistics["errors"][error_key] = {
-                                    "count": 0,
-                                    "last_error": "",
-                                    "data_sample": ""
-                                }
-                            
-                            statistics["errors"][error_key]["count"] += 1
-                            statistics["errors"][error_key]["last_error"] = str(decode_error)
-                            statistics["errors"][error_key]["data_sample"] = message.data.hex()
-                            
-                            # Only print every 1000th error to prevent log flooding
-                            if statistics["errors"][error_key]["count"] % 1000 == 1:
-                                print(f"⚠️ Error decoding message {message_name} (ID: 0x{message.arbitration_id:X}): {decode_error}")
-            
-            except can.CanError as e:
-                print(f"⚠️ CAN Bus error: {e}")
-                time.sleep(1)  # Wait a bit before retrying
+        # Drain pending frames in batches, skip ignored and quarantined IDs, and commit each
+        # decoded batch to the store at once. The decoder table and store are picked up per
+        # batch, so DBC uploads apply without restarting the loop.
+        receive_loop(bus, receive_target, receive_stats, lambda: run_can_receiver, quarantine=quarantine)
                 
     except Exception as setup_error:
         print(f"❌ Failed to setup CAN interface: {setup_error}")
     
     finally:
         # Cleanup when thread exits
+        can_bus = None
         if 'bus' in locals():
             bus.shutdown()
             print("💤 CAN bus shutdown")
 
+# One generation per batch: its decoder table, store and frame timing always belong together
+def receive_target():
+    generation = decoder_generation
+    channel = generation.channels[0]
+    return channel.decoder_table, generation.store, channel.timing
+
+# Reinstall the acceptance filters after the DBC or the ignored IDs changed
+def apply_can_filters():
+    bus = can_bus
+    if bus is not None:
+        print(f"🔎 {install_filters(bus, CAN_CHANNEL.bus.get('interface'), decoder_generation.channels[0].dbc, quarantine.ignored)}")
+
 # Start the CAN receiver in a separate thread
 can_thread = threading.Thread(target=receive_can_data, daemon=True)
 can_thread.start()
 
+# Encoded /vehicle_data bodies, shared by all pollers until the store generation advances
+vehicle_data_cache = SnapshotResponseCache()
+
+# Optional filters, e.g. ?messages=BMS_TX_STATE_7,INV_*&signals=Cell_Temp_*
+# Signals with value descriptions (VAL_) give their label, e.g. "CHARGING", when the raw value
+# has one (as cantools decodes them), and their number otherwise; /vehicle_data/history is
+# always numeric
 @app.get("/vehicle_data")
-async def get_vehicle_data():
-    return vehicle_data
+async def get_vehicle_data(request: Request, messages: Optional[str] = None, signals: Optional[str] = None):
+    store = decoder_generation.store
+    if not messages and not signals:
+        return snapshot_response(request, vehicle_data_cache, store)
+    
+    # Resolve the filters through the store's index (cached per distinct selection)
+    selection = (parse_name_list(messages), parse_name_list(signals))
+    slots = store.index.select(*selection)
+    return snapshot_response(request, vehicle_data_cache, store,
+                             build=lambda snapshot: store.as_dict(snapshot, slots), selection=selection)
+
+# Recent history for charting, e.g. ?signals=Cell_Temp_*&since=-60&max_points=300
+# downsample: "lttb" (default), "minmax" or "none"
+@app.get("/vehicle_data/history")
+async def get_vehicle_data_history(messages: Optional[str] = None, signals: Optional[str] = None,
+                                   since: Optional[float] = None, max_points: int = 500,
+                                   downsample: str = "lttb"):
+    if not messages and not signals:
+        raise HTTPException(status_code=400, detail="Select signals with ?signals= and/or ?messages=")
+    store = decoder_generation.store
+    slots = store.index.select(parse_name_list(messages), parse_name_list(signals))
+    # Reading the rings and downsampling is pure Python work: keep it off the event loop
+    payload = await asyncio.to_thread(history_payload, store, slots, since, max(3, max_points), downsample)
+    with SERIALISE_SECONDS.labels("history").time():
+        body = orjson.dumps({"signals": payload})
+    return Response(body, media_type="application/json")
+
+# Push stream of changed signals, a cheaper alternative to polling /vehicle_data
+@app.websocket("/ws/vehicle_data")
+async def stream_vehicle_data(websocket: WebSocket):
+    await push_deltas(websocket, store_changes(lambda: decoder_generation.store))
 
 @app.get("/can_statistics")
 async def get_statistics():
@@ -147,25 +152,54 @@ async def get_statistics():
     
     # Calculate uptime
     uptime = time.time() - statistics["start_time"]
+    metrics = REGISTRY.summary()
+    received = metrics["can_frames_received_total"]
+    stats = receive_stats.stats()
     
     return {
-        "messages_received": statistics["messages_received"],
-        "messages_decoded": statistics["messages_decoded"],
-        "messages_ignored": statistics["messages_ignored"],
+        "messages_received": stats["frames"],
+        "messages_decoded": stats["decoded"],
+        "messages_ignored": stats["ignored"],
         "uptime_seconds": uptime,
-        "messages_per_second": statistics["messages_received"] / max(1, uptime),
-        "error_counts": {id: data["count"] for id, data in statistics["errors"].items()},
-        "ignored_messages": [f"0x{id:X}" for id in IGNORED_MESSAGE_IDS]
+        "messages_per_second": stats["frames"] / max(1, uptime),
+        "messages_per_second_1s": received["rate_1s"],
+        "messages_per_second_10s": received["rate_10s"],
+        "messages_per_second_60s": received["rate_60s"],
+        "batches": stats["batches"],
+        "mean_batch": stats["mean_batch"],
+        "max_batch": stats["max_batch"],
+        "error_counts": {format_error_key(key): count for key, count in list(DECODE_ERRORS.counts.items())},
+        "ignored_messages": [f"0x{id:X}" for id in quarantine.ignored],
+        "quarantine": quarantine.status(),
+        "frame_timing": decoder_generation.channels[0].timing.stats(),
+        # Windowed rates and latency percentiles of the hot path (decode per frame ID,
+        # receive queue depth, store commits, logger ticks, JSON serialisation)
+        "metrics": metrics
     }
 
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def get_metrics():
+    return Response(REGISTRY.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+# Per-frame-ID rate, period, jitter, age and DLC mismatches, to spot an ECU whose cyclic
+# message slows down, bursts or stops
+@app.get("/bus_health")
+async def get_bus_health():
+    return {"frames": decoder_generation.channels[0].timing.stats()}
+
+# Decode failures per frame ID (count, latest error and payload) and the most recent
+# failures; hex dumps and messages are formatted here, not in the receive loop
 @app.get("/can_errors")
-async def get_error_details():
-    global statistics
-    return {"errors": statistics["errors"]}
+async def get_error_details(limit: int = 50):
+    return {
+        "errors": DECODE_ERRORS.summary(),
+        "recent": DECODE_ERRORS.samples(limit)
+    }
 
 @app.post("/upload_dbc/")
 async def upload_dbc(file: UploadFile = File(...)):
-    global dbc, valid_can_ids
+    global decoder_generation
     new_dbc_path = f"./uploaded_{file.filename}"
 
     # Save the new DBC file
@@ -174,44 +208,58 @@ async def upload_dbc(file: UploadFile = File(...)):
 
     # Reload the DBC
     try:
-        # Create a new database
-        new_dbc = cantools.database.Database()
-        
-        # Add all existing files
-        for dbc_path in DBC_FILE_PATHS:
-            new_dbc.add_dbc_file(dbc_path)
-        
-        # Add the newly uploaded file
-        new_dbc.add_dbc_file(new_dbc_path)
+        # Parse all existing files plus the newly uploaded one in a worker thread, so the
+        # event loop keeps serving requests while the old generation stays in use
+        config = CAN_CHANNEL._replace(dbc_files=CAN_CHANNEL.dbc_files + (new_dbc_path,))
+        generation = await asyncio.to_thread(load_generation, [config], HISTORY_POINTS,
+                                             previous=decoder_generation, strict=True)
         
-        # Replace the old database
-        dbc = new_dbc
-        valid_can_ids = {msg.frame_id: msg.name for msg in dbc.messages}
+        # Replace the old database, table and store in one step
+        decoder_generation = generation
+        apply_can_filters()
         print(f"✅ New DBC Loaded: {file.filename}")
-        return {"message": f"Successfully loaded {file.filename}", "available_messages": valid_can_ids}
+        return {"message": f"Successfully loaded {file.filename}",
+                "available_messages": generation.valid_can_ids[CAN_CHANNEL.name]}
     except Exception as e:
         return {"error": f"Failed to load DBC file: {str(e)}"}
 
 @app.get("/available_messages")
 async def get_available_messages():
-    return {"messages": valid_can_ids}
+    return {"messages": decoder_generation.valid_can_ids[CAN_CHANNEL.name]}
 
+# Same endpoints as serverdbc.py; /ignore_message is the older name, kept for existing clients
+@app.post("/quarantine/{message_id}")
 @app.post("/ignore_message/{message_id}")
 async def ignore_message(message_id: str):
     try:
-        # Convert from hex string to int
-        if message_id.startswith("0x"):
-            msg_id = int(message_id, 16)
-        else:
-            msg_id = int(message_id)
-            
-        if msg_id not in IGNORED_MESSAGE_IDS:
-            IGNORED_MESSAGE_IDS.append(msg_id)
-            return {"message": f"Now ignoring message ID: 0x{msg_id:X}"}
-        else:
-            return {"message": f"Already ignoring message ID: 0x{msg_id:X}"}
+        # Hex ("0x467") or decimal
+        msg_id = parse_frame_id(message_id)
     except ValueError:
         return {"error": "Invalid message ID format"}
+    if quarantine.ignore(msg_id):
+        apply_can_filters()
+        return {"message": f"Now ignoring message ID: 0x{msg_id:X}"}
+    else:
+        return {"message": f"Already ignoring message ID: 0x{msg_id:X}"}
+
+# Decode an ignored or quarantined message ID again
+@app.delete("/quarantine/{message_id}")
+@app.delete("/ignore_message/{message_id}")
+async def release_message(message_id: str):
+    try:
+        msg_id = parse_frame_id(message_id)
+    except ValueError:
+        return {"error": "Invalid message ID format"}
+    if quarantine.release(msg_id):
+        apply_can_filters()
+        return {"message": f"Released message ID: 0x{msg_id:X}"}
+    else:
+        return {"message": f"Message ID 0x{msg_id:X} wasn't ignored or quarantined"}
+
+# Ignored IDs, IDs quarantined after persistent decode failures and IDs being re-probed
+@app.get("/quarantine")
+async def get_quarantine():
+    return quarantine.status()
 
 @app.on_event("shutdown")
 async def shutdown_event():
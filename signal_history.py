@@ -0,0 +1,217 @@
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Most points kept per signal, and the decimation window (s): at most two points (the
+# window's minimum and maximum) are stored per window. At full depth they keep at least ~60 s
+# of history for every signal, however fast it updates.
+HISTORY_POINTS = 4096
+HISTORY_MIN_INTERVAL = 0.03
+# All rings of a store share this many bytes (16 per point and signal), allocated up front
+# (in process mode in the shared segment): up to 512 signals get HISTORY_POINTS each, 2000
+# signals get 1048 (~15 s of a signal updating every window, 32 MiB instead of 131 MB). No
+# signal gets fewer than HISTORY_MIN_POINTS, whatever the total.
+HISTORY_BUDGET = 32 * 1024 * 1024
+HISTORY_MIN_POINTS = 128
+
+
+# Points per signal for a store of `size` signals: `points` (0 disables history), fewer when
+# the rings would exceed `budget`
+def history_depth(size: int, points: int = HISTORY_POINTS, budget: int = HISTORY_BUDGET) -> int:
+    if points <= 0 or size <= 0:
+        return 0
+    return min(points, max(HISTORY_MIN_POINTS, budget // (16 * size)))
+
+
+# Fixed-size ring of (monotonic time, value) points per signal slot, stored in flat
+# float64 buffers so appending never allocates. Written by the receive thread inside
+# SignalStore.commit(); readers go through the store's seqlock. The rings live in the
+# buffer given by the store (laid out as times, values, counts, window starts, window
+# counts), so they are shared along with it when the store is in shared memory.
+#
+# Updates faster than min_interval are decimated per window without losing spikes: the
+# window's first update is stored, the second one too, and every later one replaces
+# whichever of the two it exceeds (a new maximum replaces the maximum, a new minimum the
+# minimum), keeping them in time order.
+class SignalHistory:
+    def __init__(self, size: int, points: int = HISTORY_POINTS,
+                 min_interval: float = HISTORY_MIN_INTERVAL, buffer=None, attach: bool = False):
+        self.points = points
+        self.min_interval = min_interval
+        if buffer is None:
+            buffer = bytearray(self.buffer_size(size, points))
+        view = memoryview(buffer)
+        ring = 8 * size * points
+        # Byte views are kept for read(), which copies spans with array.frombytes()
+        self._time_bytes = view[:ring]
+        self._value_bytes = view[ring:2 * ring]
+        self.times = self._time_bytes.cast('d')
+        self.values = self._value_bytes.cast('d')
+        # Total points ever appended per slot; the ring position is count % points
+        self.counts = view[2 * ring:2 * ring + 8 * size].cast('q')
+        # Start of each slot's current decimation window, and the points stored in it (1 or 2)
+        self.last_times = view[2 * ring + 8 * size:2 * ring + 16 * size].cast('d')
+        self.window_counts = view[2 * ring + 16 * size:2 * ring + 24 * size].cast('q')
+        if not attach:
+            self.last_times[:] = array('d', [float("-inf")]) * size
+        self.buffer_bytes = 16 * size * points
+
+    @staticmethod
+    def buffer_size(size: int, points: int = HISTORY_POINTS) -> int:
+        return 16 * size * points + 24 * size
+
+    def append(self, slots: Sequence[int], values, timestamp: float):
+        points = self.points
+        counts = self.counts
+        last_times = self.last_times
+        window_counts = self.window_counts
+        times = self.times
+        ring_values = self.values
+        earliest = timestamp - self.min_interval
+        for slot, value in zip(slots, values):
+            count = counts[slot]
+            if last_times[slot] <= earliest:
+                # New window
+                last_times[slot] = timestamp
+                window_counts[slot] = 0
+            elif window_counts[slot] == 2:
+                base = slot * points
+                first = base + (count - 2) % points
+                second = base + (count - 1) % points
+                first_value = ring_values[first]
+                second_value = ring_values[second]
+                if value > first_value and value > second_value:
+                    keep = first if first_value < second_value else second
+                elif value < first_value and value < second_value:
+                    keep = first if first_value > second_value else second
+                else:
+                    continue
+                # The other extreme moves to the first position, this update becomes the second
+                if keep != first:
+                    times[first] = times[keep]
+                    ring_values[first] = ring_values[keep]
+                times[second] = timestamp
+                ring_values[second] = value
+                continue
+            index = slot * points + count % points
+            times[index] = timestamp
+            ring_values[index] = value
+            counts[slot] = count + 1
+            window_counts[slot] += 1
+
+    # Points of one slot, oldest first, with time >= since
+    def read(self, slot: int, since: float) -> Tuple[array, array]:
+        points = self.points
+        count = self.counts[slot]
+        base = slot * points
+        time_bytes = self._time_bytes
+        value_bytes = self._value_bytes
+        times = array('d')
+        values = array('d')
+        if count <= points:
+            times.frombytes(time_bytes[8 * base:8 * (base + count)])
+            values.frombytes(value_bytes[8 * base:8 * (base + count)])
+        else:
+            split = 8 * (base + count % points)
+            start = 8 * base
+            end = 8 * (base + points)
+            times.frombytes(time_bytes[split:end])
+            times.frombytes(time_bytes[start:split])
+            values.frombytes(value_bytes[split:end])
+            values.frombytes(value_bytes[start:split])
+        start = bisect_left(times, since)
+        return times[start:], values[start:]
+
+
+# Largest-Triangle-Three-Buckets downsampling: keeps the visual shape of a series in
+# `threshold` points (first and last points are always kept)
+def lttb(times: Sequence[float], values: Sequence[float], threshold: int) -> Tuple[List[float], List[float]]:
+    length = len(times)
+    if threshold >= length or threshold < 3:
+        return list(times), list(values)
+    out_times = [times[0]]
+    out_values = [values[0]]
+    bucket_size = (length - 2) / (threshold - 2)
+    a = 0
+    for bucket in range(threshold - 2):
+        # Average of the next bucket is the third point of the triangle
+        next_start = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, length)
+        span = next_end - next_start
+        avg_time = sum(times[next_start:next_end]) / span
+        avg_value = sum(values[next_start:next_end]) / span
+        # Pick the point of this bucket forming the largest triangle with a and the average
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        time_a = times[a]
+        value_a = values[a]
+        best_area = -1.0
+        best = start
+        for index in range(start, end):
+            area = abs((time_a - avg_time) * (values[index] - value_a)
+                       - (time_a - times[index]) * (avg_value - value_a))
+            if area > best_area:
+                best_area = area
+                best = index
+        out_times.append(times[best])
+        out_values.append(values[best])
+        a = best
+    out_times.append(times[-1])
+    out_values.append(values[-1])
+    return out_times, out_values
+
+
+# Min/max downsampling: the minimum and maximum of each bucket, in time order, so spikes survive
+def min_max(times: Sequence[float], values: Sequence[float], max_points: int) -> Tuple[List[float], List[float]]:
+    length = len(times)
+    buckets = max_points // 2
+    if max_points >= length or buckets < 1:
+        return list(times), list(values)
+    out_times = []
+    out_values = []
+    for bucket in range(buckets):
+        start = bucket * length // buckets
+        end = (bucket + 1) * length // buckets
+        if start == end:
+            continue
+        chunk = values[start:end]
+        low = start + chunk.index(min(chunk))
+        high = start + chunk.index(max(chunk))
+        for index in sorted({low, high}):
+            out_times.append(times[index])
+            out_values.append(values[index])
+    return out_times, out_values
+
+
+DOWNSAMPLERS = {
+    "lttb": lttb,
+    "minmax": min_max
+}
+
+
+# /vehicle_data/history payload for a selection of slots. `since` is epoch seconds, or
+# seconds before now when negative (since=-60 is the last minute); times are returned as
+# epoch seconds.
+def history_payload(store, slots: Sequence[int], since: Optional[float], max_points: int,
+                    downsample: str) -> Dict[str, Dict[str, List[float]]]:
+    wall_offset = time.time() - time.monotonic()
+    if since is None:
+        since_monotonic = float("-inf")
+    elif since < 0:
+        since_monotonic = time.monotonic() + since
+    else:
+        since_monotonic = since - wall_offset
+    reduce = DOWNSAMPLERS.get(downsample)
+    payload = {}
+    for slot in slots:
+        times, values = store.read_history(slot, since_monotonic)
+        if not times:
+            continue
+        if reduce is not None:
+            times, values = reduce(times, values, max_points)
+        payload[store.keys[slot]] = {
+            "t": [t + wall_offset for t in times],
+            "v": list(values)
+        }
+    return payload
@@ -0,0 +1,244 @@
+import fnmatch
+import secrets
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from signal_history import SignalHistory
+
+
+# Consistent copy of the store taken by a reader
+class Snapshot(NamedTuple):
+    generation: int
+    values: array
+    timestamps: array
+
+
+# Number of resolved selections each index remembers
+SELECTION_CACHE_SIZE = 256
+
+GLOB_CHARS = frozenset("*?[")
+
+
+# "A,B_*" -> ("A", "B_*"); empty or None -> ()
+def parse_name_list(names: Optional[str]) -> Tuple[str, ...]:
+    if not names:
+        return ()
+    return tuple(name.strip() for name in names.split(",") if name.strip())
+
+
+# Message and signal name -> slots lookup, built with the store at DBC load time.
+# Resolved selections are cached, so repeated filtered requests cost O(selected signals).
+# Keys of named channels ("inverter.INV_Status.Speed") are found by their channel-qualified
+# names and by the plain DBC names too: ?messages=INV_Status selects the message on every
+# channel that has it, ?messages=inverter.INV_Status only the inverter's.
+class SignalIndex:
+    def __init__(self, keys: Sequence[str]):
+        self.slots = {key: slot for slot, key in enumerate(keys)}
+        self.by_message: Dict[str, List[int]] = {}
+        self.by_signal: Dict[str, List[int]] = {}
+        # "Message.Signal" -> slots, for signal patterns with a "." (without the channel prefix)
+        self.by_message_signal: Dict[str, List[int]] = {}
+        for slot, key in enumerate(keys):
+            message_name, _, signal_name = key.rpartition(".")
+            self.by_message.setdefault(message_name, []).append(slot)
+            self.by_signal.setdefault(signal_name, []).append(slot)
+            _, _, plain_message = message_name.rpartition(".")
+            self.by_message_signal.setdefault(f"{plain_message}.{signal_name}", []).append(slot)
+            if plain_message != message_name:
+                self.by_message.setdefault(plain_message, []).append(slot)
+        self._cache: Dict[Tuple, Tuple[int, ...]] = {}
+
+    @staticmethod
+    def _match(pattern: str, names: Dict[str, list]) -> Iterable[str]:
+        if GLOB_CHARS.isdisjoint(pattern):
+            return (pattern,) if pattern in names else ()
+        return fnmatch.filter(names, pattern)
+
+    # Slots selected by message names and signal names (globs allowed, results are combined).
+    # A signal pattern containing "." is matched against full "Message.Signal" keys.
+    def select(self, messages: Tuple[str, ...] = (), signals: Tuple[str, ...] = ()) -> Tuple[int, ...]:
+        selection = (messages, signals)
+        cached = self._cache.get(selection)
+        if cached is not None:
+            return cached
+        selected = set()
+        for pattern in messages:
+            for name in self._match(pattern, self.by_message):
+                selected.update(self.by_message[name])
+        for pattern in signals:
+            if "." in pattern:
+                selected.update(self.slots[key] for key in self._match(pattern, self.slots))
+                for name in self._match(pattern, self.by_message_signal):
+                    selected.update(self.by_message_signal[name])
+            else:
+                for name in self._match(pattern, self.by_signal):
+                    selected.update(self.by_signal[name])
+        result = tuple(sorted(selected))
+        if len(self._cache) >= SELECTION_CACHE_SIZE:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[selection] = result
+        return result
+
+
+# Compact storage for the latest decoded value of every signal.
+#
+# Every "Message.Signal" key gets a stable slot index when the DBC is loaded. Values and
+# last-update times (receive time of the frame on the time.monotonic() clock, 0.0 = never
+# received) live in one preallocated
+# buffer, so updates never resize anything. There is one writer at a time (the receive
+# thread); readers use a seqlock: the sequence counter is odd while a commit is in
+# progress, and a snapshot is only accepted if the counter was even and unchanged across
+# the copy.
+#
+# The buffer is laid out as [seq uint64][values float64 * n][timestamps float64 * n]
+# followed by the optional history rings. By default it is a private bytearray; passing a
+# multiprocessing.shared_memory buffer lets a separate acquisition process write the store
+# while the API process reads it (attach=True maps an already initialised buffer, and a
+# read-only memoryview makes any write from the reader fail).
+#
+# With several writers (one receive worker per CAN channel) commits are serialised by
+# write_lock: a threading.Lock, or a multiprocessing lock when the writers are processes.
+class SignalStore:
+    def __init__(self, keys: Sequence[str], history_points: int = 0, buffer=None, attach: bool = False,
+                 write_lock=None):
+        self.keys = tuple(keys)
+        self.index = SignalIndex(self.keys)
+        self.slots = self.index.slots
+        size = len(self.keys)
+        if buffer is None:
+            buffer = bytearray(self.buffer_size(size, history_points))
+        view = memoryview(buffer)
+        self._seq = view[:8].cast('Q')
+        # Byte views for snapshot copies (array.frombytes() only takes byte buffers)
+        self._value_bytes = view[8:8 + 8 * size]
+        self._timestamp_bytes = view[8 + 8 * size:8 + 16 * size]
+        self.values = self._value_bytes.cast('d')
+        self.timestamps = self._timestamp_bytes.cast('d')
+        if not attach:
+            self.values[:] = array('d', [float("nan")]) * size
+        # Distinguishes this store's generations from those of earlier stores/processes
+        self.epoch = secrets.token_hex(4)
+        # Labels of signals with value descriptions, slot -> {raw value: label}
+        # (can_decoder.signal_choices); values stay raw numbers, as_dict() serves the labels
+        self.choices: Dict[int, Dict[int, str]] = {}
+        # Optional per-signal history ring, appended to inside commit()
+        self.history = None
+        if history_points:
+            self.history = SignalHistory(size, history_points, buffer=view[8 + 16 * size:], attach=attach)
+        # Optional change watcher (on-change logging), called inside commit()
+        self.watch = None
+        self.write_lock = write_lock
+
+    # Bytes needed for a store of `size` signals (the size of a shared-memory segment)
+    @staticmethod
+    def buffer_size(size: int, history_points: int = 0) -> int:
+        history_bytes = SignalHistory.buffer_size(size, history_points) if history_points else 0
+        return 8 + 16 * size + history_bytes
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Number of completed commits; advances whenever any value changes
+    @property
+    def generation(self) -> int:
+        return self._seq[0] >> 1
+
+    # Writer side: store one decoded frame
+    def commit(self, slots: Iterable[int], values: Iterable[float], timestamp: float):
+        self.commit_batch(((slots, values, timestamp),))
+
+    # Writer side: store a batch of decoded frames as one commit (one generation bump),
+    # given as (slots, values, timestamp) triples, each frame with its own receive time
+    def commit_batch(self, batch: Iterable[Tuple[Sequence[int], Iterable[float], float]]):
+        write_lock = self.write_lock
+        if write_lock is None:
+            self._write(batch)
+        else:
+            with write_lock:
+                self._write(batch)
+
+    def _write(self, batch):
+        store_values = self.values
+        store_timestamps = self.timestamps
+        history = self.history
+        watch = self.watch
+        seq = self._seq
+        seq[0] += 1
+        for slots, values, timestamp in batch:
+            for slot, value in zip(slots, values):
+                store_values[slot] = value
+                store_timestamps[slot] = timestamp
+            if history is not None:
+                history.append(slots, values, timestamp)
+            if watch is not None:
+                watch.observe(slots, values, timestamp)
+        seq[0] += 1
+
+    # Reader side: copy both buffers, retrying while a commit is in progress
+    def snapshot(self) -> Snapshot:
+        while True:
+            seq = self._seq[0]
+            if not seq & 1:
+                values = array('d')
+                values.frombytes(self._value_bytes)
+                timestamps = array('d')
+                timestamps.frombytes(self._timestamp_bytes)
+                if self._seq[0] == seq:
+                    return Snapshot(seq >> 1, values, timestamps)
+            # Let the writer finish its commit
+            time.sleep(0)
+
+    # History points of one slot since a monotonic time, read under the seqlock
+    def read_history(self, slot: int, since: float) -> Tuple[array, array]:
+        if self.history is None:
+            return array('d'), array('d')
+        while True:
+            seq = self._seq[0]
+            if not seq & 1:
+                times, values = self.history.read(slot, since)
+                if self._seq[0] == seq:
+                    return times, values
+            time.sleep(0)
+
+    # Received signals as a {key: value} dict, matching the old vehicle_data layout,
+    # optionally restricted to a selection of slots. Signals with value descriptions give
+    # their label (e.g. "CHARGING") when the raw value has one, like cantools' decode_choices.
+    def as_dict(self, snapshot: Optional[Snapshot] = None,
+                slots: Optional[Sequence[int]] = None) -> Dict[str, Any]:
+        if snapshot is None:
+            snapshot = self.snapshot()
+        values = snapshot.values
+        timestamps = snapshot.timestamps
+        keys = self.keys
+        if slots is None:
+            result = {key: values[slot] for slot, key in enumerate(keys) if timestamps[slot]}
+        else:
+            result = {keys[slot]: values[slot] for slot in slots if timestamps[slot]}
+        for slot, labels in self.choices.items():
+            key = keys[slot]
+            if key in result:
+                result[key] = labels.get(values[slot], values[slot])
+        return result
+
+    # Labels of the value-described signals among `keys`, by position (for log writers)
+    def column_choices(self, keys: Sequence[str]) -> Dict[int, Dict[int, str]]:
+        slots = self.slots
+        choices = self.choices
+        return {column: choices[slots[key]] for column, key in enumerate(keys) if slots.get(key) in choices}
+
+    # Slot indices for a list of keys, skipping keys this store doesn't know
+    def slots_for(self, keys: Iterable[str]) -> List[int]:
+        slots = self.slots
+        return [slots[key] for key in keys if key in slots]
+
+    # Copy values of keys that exist in both stores (used when a new DBC is loaded)
+    def carry_over(self, old: "SignalStore"):
+        snapshot = old.snapshot()
+        self._seq[0] += 1
+        for slot, key in enumerate(old.keys):
+            new_slot = self.slots.get(key)
+            if new_slot is not None and snapshot.timestamps[slot]:
+                self.values[new_slot] = snapshot.values[slot]
+                self.timestamps[new_slot] = snapshot.timestamps[slot]
+        self._seq[0] += 1
@@ -0,0 +1,139 @@
+import asyncio
+import copy
+from array import array
+from typing import Any, Callable, Dict, Optional, Set
+
+import orjson
+from fastapi import WebSocket, WebSocketDisconnect
+
+from metrics import SERIALISE_SECONDS
+
+# Push rate limits per client (Hz)
+DEFAULT_RATE_HZ = 10.0
+MIN_RATE_HZ = 0.1
+MAX_RATE_HZ = 100.0
+
+_MISSING = object()
+
+
+# Per-connection state: the subscription plus whatever the change collector needs to diff
+class StreamClient:
+    def __init__(self, signals: Optional[Set[str]], max_rate_hz: float):
+        self.signals = signals
+        self.max_rate_hz = max_rate_hz
+        # Set when the subscription changes, so the next push starts from a full set
+        self.reset = True
+        self.source = None
+        self.generation = -1
+        self.slots = None
+        self.last = None
+
+
+def clamp_rate(rate_hz) -> float:
+    try:
+        rate_hz = float(rate_hz)
+    except (TypeError, ValueError):
+        return DEFAULT_RATE_HZ
+    return min(MAX_RATE_HZ, max(MIN_RATE_HZ, rate_hz))
+
+
+# "a,b,c" (query string) or ["a", "b"] (JSON) -> set of keys; empty/None means everything
+def parse_signals(signals) -> Optional[Set[str]]:
+    if not signals:
+        return None
+    if isinstance(signals, str):
+        signals = signals.split(",")
+    return {signal.strip() for signal in signals if signal.strip()} or None
+
+
+# Change collector for a SignalStore: returns only subscribed signals whose value changed
+# since this client's last push, or None when the store hasn't advanced at all
+def store_changes(get_store: Callable[[], Any]) -> Callable[[StreamClient], Optional[Dict[str, float]]]:
+    def collect(client: StreamClient):
+        store = get_store()
+        if client.reset or store is not client.source:
+            # New client, new subscription or new DBC: resend everything subscribed
+            client.source = store
+            client.generation = -1
+            client.last = array('d', [float("nan")]) * len(store)
+            client.slots = range(len(store)) if client.signals is None else store.slots_for(client.signals)
+            client.reset = False
+        if store.generation == client.generation:
+            return None
+        snapshot = store.snapshot()
+        client.generation = snapshot.generation
+        values = snapshot.values
+        timestamps = snapshot.timestamps
+        last = client.last
+        keys = store.keys
+        choices = store.choices
+        changes = {}
+        for slot in client.slots:
+            value = values[slot]
+            if value != last[slot] and timestamps[slot]:
+                labels = choices.get(slot)
+                changes[keys[slot]] = labels.get(value, value) if labels else value
+                last[slot] = value
+        return changes
+
+    return collect
+
+
+# Change collector for a plain dict of values (the mock server's vehicle_data)
+def dict_changes(data: Dict[str, Any]) -> Callable[[StreamClient], Optional[Dict[str, Any]]]:
+    def collect(client: StreamClient):
+        if client.reset or client.last is None:
+            client.last = {}
+            client.reset = False
+        last = client.last
+        keys = list(data) if client.signals is None else [key for key in client.signals if key in data]
+        changes = {}
+        for key in keys:
+            value = data[key]
+            if last.get(key, _MISSING) != value:
+                changes[key] = value
+                last[key] = copy.deepcopy(value)
+        return changes
+
+    return collect
+
+
+# Apply subscription updates sent by the client: {"signals": [...], "max_rate_hz": 20}
+async def _read_subscriptions(websocket: WebSocket, client: StreamClient):
+    while True:
+        try:
+            request = await websocket.receive_json()
+        except WebSocketDisconnect:
+            return
+        except ValueError:
+            continue
+        if not isinstance(request, dict):
+            continue
+        if "signals" in request:
+            client.signals = parse_signals(request["signals"])
+            client.reset = True
+        if "max_rate_hz" in request:
+            client.max_rate_hz = clamp_rate(request["max_rate_hz"])
+
+
+# Serve one /ws/vehicle_data connection: the first message carries every subscribed signal,
+# later ones only the signals that changed, at most max_rate_hz messages per second.
+# Query parameters: ?signals=A.x,B.y&max_rate_hz=20
+async def push_deltas(websocket: WebSocket, collect_changes: Callable[[StreamClient], Optional[Dict[str, Any]]]):
+    await websocket.accept()
+    client = StreamClient(parse_signals(websocket.query_params.get("signals")),
+                          clamp_rate(websocket.query_params.get("max_rate_hz", DEFAULT_RATE_HZ)))
+    reader = asyncio.create_task(_read_subscriptions(websocket, client))
+    try:
+        while not reader.done():
+            changes = collect_changes(client)
+            if changes:
+                with SERIALISE_SECONDS.labels("ws_vehicle_data").time():
+                    text = orjson.dumps({"values": changes}).decode()
+                await websocket.send_text(text)
+            # Coalesce: whatever changes during the wait goes out in the next message
+            await asyncio.wait({reader}, timeout=1 / client.max_rate_hz)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        reader.cancel()